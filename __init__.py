@@ -1,14 +1,33 @@
-from game import Game, Player
-from server.server import async_host_game
+from server.rooms import RoomRegistry
+from server.journal import Journal
+from server.server import async_host_game, HOST, PORT
+from server.sharded import host_sharded
+from server.logs import logger, fields, setup_logging, SAMPLE
+from bot import BUDGET, POOL_BUDGET
 from asyncio import run
+from argparse import ArgumentParser
 
 if __name__ == "__main__":
-    game = Game()
+    parser = ArgumentParser(description="Hosts UNO rooms.")
+    parser.add_argument("--journal", help="journal file; with one, rooms survive a restart")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes to shard rooms across")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--metrics-port", type=int, help="serve metrics over HTTP on this port (per worker: port + i)")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--log-sample", type=int, default=SAMPLE, help="keep one in this many per-message DEBUG records")
+    parser.add_argument("--shuffle-pool", type=int, default=0, help="decks to keep shuffled ahead of room creation (per worker)")
+    parser.add_argument("--bot-budget", type=float, default=BUDGET,
+                        help=f"seconds a bot may think per move; from {POOL_BUDGET} rollouts use the other cores")
+    args = parser.parse_args()
 
-    # game.add_player(Player("Luna", game.deck))
-    # game.add_player(Player("Rose", game.deck))
-    # game.add_player(Player("Skye", game.deck))
+    setup_logging(args.log_level, args.log_sample)
+    if args.workers > 1:
+        host_sharded(args.workers, args.host, args.port, args.journal, args.metrics_port, args.log_level, args.log_sample, args.shuffle_pool, args.bot_budget)
+    else:
+        rooms = RoomRegistry()
+        if args.journal is not None:
+            logger.info("recovered", extra=fields(rooms=rooms.recover(args.journal)))
+            rooms.journal = Journal(args.journal)
 
-    # game.start()
-
-    run(async_host_game(game))
+        run(async_host_game(rooms, args.host, args.port, args.metrics_port, args.shuffle_pool, args.bot_budget))
@@ -0,0 +1,220 @@
+"""Microbenchmarks of the core engine: Deck, Pile, Hand, Card, Game.process for every
+RequestType, snapshots, and a full headless game.
+
+Every case separates its setup from the timed operation, so operations that consume state
+(drawing, playing, joining) are timed on fresh state without timing its construction. Each
+case is warmed up, calibrated to run for about `target` seconds per repeat, then repeated
+with the garbage collector paused; the median and minimum of the repeats are reported.
+
+Run from the repository root:  python -m benchmarks.engine [--filter TEXT] [--json PATH] [--compare PATH]
+--json writes the results, and --compare prints the change against results written earlier.
+"""
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Callable
+
+from deck import Deck, Card, CARDS, WILD_ID, Colour, SHUFFLES
+from game import Game, Player
+from hand import Hand
+from pile import Pile
+from server.base import BroadcastManager, RequestType
+
+PLAYERS = ("Luna", "Rose", "Skye", "Iris")
+
+
+class Case:
+    """An operation to time. setup() builds the state of one operation outside the timing;
+    run(state) is the timed operation, and counts as `ops` operations."""
+    name: str
+    setup: Callable[[], object]
+    run: Callable[[object], object]
+    ops: int
+
+    def __init__(self, name: str, setup: Callable[[], object], run: Callable[[object], object], ops: int = 1):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.ops = ops
+
+    def time(self, number: int) -> float:
+        """Times number operations on fresh state, returning the seconds taken per op."""
+        states = [self.setup() for _ in range(number)]
+        run = self.run
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for state in states:
+                run(state)
+            elapsed = time.perf_counter() - start
+        finally:
+            if enabled:
+                gc.enable()
+        return elapsed / (number * self.ops)
+
+    def measure(self, repeat: int, target: float) -> dict:
+        self.time(1) # warmup
+        number = 1
+        while (elapsed := self.time(number) * number * self.ops) < target / 10 and number < 1_000_000:
+            number *= 10
+        number = max(1, int(number * target / max(elapsed, 1e-9)))
+
+        samples = sorted(self.time(number) for _ in range(repeat))
+        return {
+            "ns": statistics.median(samples) * 1e9,
+            "min_ns": samples[0] * 1e9,
+            "spread": (samples[-1] - samples[0]) / samples[0] if samples[0] else 0.0,
+            "number": number,
+        }
+
+
+def seated(seed: int = 1) -> Game:
+    game = Game(seed=seed)
+    game.broadcast_manager = BroadcastManager()
+    for name in PLAYERS:
+        game.add_player(Player(name, game.deck))
+    return game
+
+def started(seed: int = 1) -> Game:
+    game = seated(seed)
+    game.start()
+    return game
+
+def named(request_type: str) -> tuple[Game, dict]:
+    """A started game and a request of request_type from its current player."""
+    game = started()
+    return game, {"type": request_type, "uuid": game.current_player().uuid.hex}
+
+def playable(seed: int = 1) -> tuple[Game, dict]:
+    """A started game and a play request for a coloured card its current player can play."""
+    while True:
+        game = started(seed)
+        player = game.current_player()
+        for index in player.hand.legal_moves(game.pile):
+            if player.hand.cards[index].colour != Colour.WILD:
+                return game, {"type": RequestType.PLAY, "uuid": player.uuid.hex, "index": index}
+        seed += 1
+
+def holding_wild() -> tuple[Game, dict]:
+    game = started()
+    player = game.current_player()
+    player.hand.add([Card.from_id(WILD_ID)])
+    return game, {
+        "type": RequestType.SET_WILD_COLOUR, "uuid": player.uuid.hex,
+        "index": len(player.hand.cards) - 1, "wild_colour": "red",
+    }
+
+def batched_wild() -> tuple[Game, dict]:
+    """A wild card's colour set and the card played in one batch."""
+    game, data = holding_wild()
+    return game, {"type": RequestType.BATCH, "uuid": data["uuid"], "operations": [
+        {"type": RequestType.SET_WILD_COLOUR, "index": data["index"], "wild_colour": "red"},
+        {"type": RequestType.PLAY, "index": data["index"]},
+    ]}
+
+def turn(game: Game) -> None:
+    """Plays the current player's first legal move, or draws."""
+    player = game.current_player()
+    uuid = player.uuid.hex
+    for index in player.hand.legal_moves(game.pile):
+        if player.hand.cards[index].colour == Colour.WILD:
+            game.process({"type": RequestType.SET_WILD_COLOUR, "uuid": uuid, "index": index, "wild_colour": "red"})
+        game.process({"type": RequestType.PLAY, "uuid": uuid, "index": index})
+        return
+    game.process({"type": RequestType.DRAW, "uuid": uuid})
+
+def full_game(game: Game) -> None:
+    while not game.finished:
+        turn(game)
+
+
+def pooled() -> None:
+    """Puts one more shuffled deck in the pool, for the next Game to take."""
+    SHUFFLES.size = len(SHUFFLES) + 1
+    SHUFFLES.fill(1)
+
+def process(state: tuple[Game, dict]) -> dict:
+    return state[0].process(state[1])
+
+def shared(make: Callable[[], object]) -> Callable[[], object]:
+    """Setup for operations that leave their state unchanged, so it is built once."""
+    state = make()
+    return lambda: state
+
+
+def cases() -> list[Case]:
+    red_five = Card.from_data({"colour": "red", "value": "5"})
+    red_seven = Card.from_data({"colour": "red", "value": "7"})
+    snapshot = started().snapshot()
+
+    return [
+        Case("Deck.__init__", lambda: None, lambda _: Deck(seed=1)),
+        Case("Deck.shuffle", lambda: Deck(seed=1), Deck.shuffle),
+        Case("Deck.draw(7)", lambda: Deck(seed=1), lambda deck: deck.draw(7)),
+        Case("Pile.is_valid", shared(lambda: Pile([red_five])), lambda pile: [pile.is_valid(card) for card in CARDS], len(CARDS)),
+        Case("Pile.play", lambda: Pile([red_five]), lambda pile: pile.play(red_seven)),
+        Case("Hand.play", lambda: (Hand(Deck(seed=1).draw(7)), Pile()), lambda state: state[0].play(0, state[1])),
+        Case("Hand.as_data", shared(lambda: Hand(Deck(seed=1).draw(7))), Hand.as_data),
+        Case("Hand.legal_moves", shared(lambda: (Hand(Deck(seed=1).draw(7)), Pile([red_five]))), lambda state: state[0].legal_moves(state[1])),
+        Case("Card.from_data", shared(red_five.as_data), Card.from_data),
+        Case("Card.__str__", shared(lambda: red_five), str),
+
+        Case(f"process {RequestType.JOIN}", lambda: (seated(), {"type": RequestType.JOIN, "name": "Ivy"}), process),
+        Case(f"process {RequestType.LEAVE}", lambda: named(RequestType.LEAVE), process),
+        Case(f"process {RequestType.START_GAME}", lambda: (seated(), {"type": RequestType.START_GAME}), process),
+        Case(f"process {RequestType.CALL_UNO}", lambda: named(RequestType.CALL_UNO), process),
+        Case(f"process {RequestType.PLAY}", playable, process),
+        Case(f"process {RequestType.DRAW}", lambda: named(RequestType.DRAW), process),
+        Case(f"process {RequestType.SET_WILD_COLOUR}", holding_wild, process),
+        Case(f"process {RequestType.BATCH}", batched_wild, process),
+        Case(f"process {RequestType.QUERY_TOP_CARD}", shared(lambda: (started(), {"type": RequestType.QUERY_TOP_CARD})), process),
+        Case(f"process {RequestType.QUERY_HAND}", shared(lambda: named(RequestType.QUERY_HAND)), process),
+        Case(f"process {RequestType.QUERY_CARD_COUNTS}", shared(lambda: named(RequestType.QUERY_CARD_COUNTS)), process),
+        Case(f"process {RequestType.QUERY_NAMES}", shared(lambda: named(RequestType.QUERY_NAMES)), process),
+        Case(f"process {RequestType.SNAPSHOT}", shared(lambda: named(RequestType.SNAPSHOT)), process),
+
+        Case("Game.__init__", lambda: None, lambda _: Game()),
+        Case("Game.__init__ pooled", pooled, lambda _: Game()),
+        Case("Game.snapshot", shared(started), Game.snapshot),
+        Case("Game.restore", shared(lambda: snapshot), Game.restore),
+        Case("headless game", started, full_game),
+    ]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--target", type=float, default=0.1, help="seconds per repeat")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results written by an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)["cases"]
+
+    results = {}
+    print(f"{'case':<28}{'median':>12}{'min':>12}{'spread':>8}" + (f"{'change':>9}" if baseline else ""))
+    for case in cases():
+        if args.filter not in case.name:
+            continue
+        result = results[case.name] = case.measure(args.repeat, args.target)
+        line = f"{case.name:<28}{result['ns']:>10.0f}ns{result['min_ns']:>10.0f}ns{result['spread']:>7.1%}"
+        if case.name in baseline:
+            line += f"{result['ns'] / baseline[case.name]['ns'] - 1:>+9.1%}"
+        print(line)
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump({"python": sys.version, "platform": platform.platform(), "cases": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
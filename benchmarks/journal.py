@@ -0,0 +1,86 @@
+"""Measures journal write cost and how long recovery takes to rebuild many rooms.
+
+Run from the repository root:  python -m benchmarks.journal [rooms] [moves]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from deck import Colour
+from game import Game
+from server.journal import Journal
+from server.rooms import RoomRegistry
+
+
+def fingerprint(game: Game) -> tuple:
+    return (
+        game.seq,
+        game.direction,
+        game.player_index,
+        game.pile.top_card().code,
+        bytes(game.deck.ids),
+        tuple((player.uuid, tuple(card.code for card in player.hand.cards)) for player in game.players),
+    )
+
+
+def play(rooms: RoomRegistry, room_id: str, moves: int, rng: random.Random):
+    room = rooms.get_or_create(room_id)
+    for name in ("Luna", "Rose", "Skye"):
+        rooms.dispatch(room, {"type": "join", "name": name})
+    rooms.dispatch(room, {"type": "start_game"})
+    # refused once the game is running, and must leave the deck as it was
+    rooms.dispatch(room, {"type": "join", "name": "Late"})
+    rooms.dispatch(room, {"type": "add_bot", "name": "Late bot"})
+
+    game = room.game
+    for _ in range(moves):
+        if not game.ongoing:
+            return
+        player = game.current_player()
+        legal = player.hand.legal_moves(game.pile)
+        if not legal:
+            rooms.dispatch(room, {"type": "draw", "uuid": player.uuid.hex})
+            continue
+        index = rng.choice(legal)
+        if player.hand.cards[index].colour == Colour.WILD:
+            rooms.dispatch(room, {"type": "set_wild_colour", "uuid": player.uuid.hex, "index": index, "wild_colour": "blue"})
+        rooms.dispatch(room, {"type": "play", "uuid": player.uuid.hex, "index": index})
+
+
+def main(n_rooms: int = 10000, moves: int = 20):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal")
+        journal = Journal(path)
+        rooms = RoomRegistry(journal)
+
+        start = time.perf_counter()
+        for i in range(n_rooms):
+            play(rooms, f"room-{i}", moves, rng)
+        played = time.perf_counter() - start
+
+        records = len(journal.pending)
+        start = time.perf_counter()
+        journal.close()
+        flushed = time.perf_counter() - start
+
+        expected = {room_id: fingerprint(room.game) for room_id, room in rooms.rooms.items()}
+
+        start = time.perf_counter()
+        recovered = RoomRegistry()
+        count = recovered.recover(path)
+        elapsed = time.perf_counter() - start
+
+        mismatched = sum(fingerprint(recovered.get(room_id).game) != state for room_id, state in expected.items())
+
+        print(f"rooms played:       {n_rooms} ({played:.2f}s including journaling)")
+        print(f"journal:            {records} records, {os.path.getsize(path) / 2**20:.1f} MiB, written in {flushed * 1e3:.1f} ms")
+        print(f"rooms recovered:    {count} (finished rooms are retired)")
+        print(f"recovery time:      {elapsed:.2f}s ({elapsed / max(count, 1) * 1e6:.0f} us/room)")
+        print(f"state mismatches:   {mismatched}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,258 @@
+"""Load generator: scripted bot clients playing real games against a running server.
+
+Every table is a room of bots, each on its own connection. The bots join, one of them
+starts the game, and on each turn the current bot queries its hand and plays its first
+legal move (choosing a colour for wilds) or draws. When a game ends its bots disconnect
+and a new table takes its place, until the run is over.
+
+Request latency is the time from sending a request to receiving its response, matched by
+message_uuid. Broadcast latency is the time from sending the request that changed the
+game to each bot receiving the resulting broadcasts, and is reported under the type of
+that request. All results can be written as JSON for comparison between runs.
+
+Run from the repository root:  python -m benchmarks.loadgen [--tables N] [--seconds S] [--json PATH]
+By default a server is started on a spare port for the run; --port targets one already running.
+"""
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from typing import Optional
+from uuid import uuid4
+
+from server.base import RequestType
+
+HOST = "127.0.0.1"
+COLOURS = ("red", "green", "blue", "yellow")
+GAME_TIMEOUT = 60 # seconds before a stalled table is abandoned
+
+
+class Stats:
+    requests: dict[str, list[float]]
+    broadcasts: dict[str, list[float]]
+    sent: int
+    received: int
+    games: int
+    errors: int
+
+    def __init__(self):
+        self.requests = defaultdict(list)
+        self.broadcasts = defaultdict(list)
+        self.sent = 0
+        self.received = 0
+        self.games = 0
+        self.errors = 0
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def summary(latencies: dict[str, list[float]]) -> dict:
+    results = {}
+    for request_type, samples in sorted(latencies.items()):
+        samples.sort()
+        results[request_type] = {
+            "count": len(samples),
+            **{name: percentile(samples, q) * 1000 for name, q in (("p50", .5), ("p95", .95), ("p99", .99))},
+        }
+    return results
+
+
+class Bot:
+    table: "Table"
+    uuid: Optional[str]
+    pending: dict[str, tuple[str, float, asyncio.Future]]
+
+    def __init__(self, table: "Table", name: str):
+        self.table = table
+        self.name = name
+        self.uuid = None
+        self.pending = {}
+
+    async def connect(self, port: int):
+        self.reader, self.writer = await asyncio.open_connection(HOST, port)
+        self.listener = asyncio.create_task(self.listen())
+
+    def close(self):
+        self.listener.cancel()
+        self.writer.close()
+
+    async def request(self, data: dict) -> dict:
+        stats = self.table.stats
+        message_uuid = uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        sent = time.perf_counter()
+        self.pending[message_uuid] = (data["type"], sent, future)
+        if data["type"] in (RequestType.START_GAME, RequestType.PLAY, RequestType.DRAW):
+            self.table.trigger = (data["type"], sent)
+
+        self.writer.write(json.dumps({**data, "message_uuid": message_uuid, "room": self.table.room_id}).encode() + b"\n")
+        stats.sent += 1
+        response = await future
+        if response.get("status") == "error":
+            stats.errors += 1
+        return response
+
+    async def listen(self):
+        stats = self.table.stats
+        try:
+            while line := await self.reader.readline():
+                received = time.perf_counter()
+                stats.received += 1
+                data = json.loads(line)
+                if data["type"] == "response":
+                    request_type, sent, future = self.pending.pop(data["responding_to"])
+                    stats.requests[request_type].append(received - sent)
+                    future.set_result(data)
+                    continue
+
+                request_type, sent = self.table.trigger
+                stats.broadcasts[request_type].append(received - sent)
+                self.on_broadcast(data)
+        except ConnectionError:
+            pass
+
+    def on_broadcast(self, data: dict):
+        for event in data["events"] if data["type"] == "batch" else (data,):
+            if event["type"] in ("game_start", "turn") and event["current_player"]["uuid"] == self.uuid:
+                asyncio.create_task(self.take_turn())
+            elif event["type"] == "game_end":
+                self.table.done.set()
+
+    async def join(self):
+        self.uuid = (await self.request({"type": RequestType.JOIN, "name": self.name}))["uuid"]
+
+    async def take_turn(self):
+        response = await self.request({"type": RequestType.QUERY_HAND, "uuid": self.uuid})
+        if response.get("status") != "done":
+            return
+
+        for index in response["legal_moves"]:
+            if response["hand"][index]["colour"] == "wild":
+                await self.request({
+                    "type": RequestType.SET_WILD_COLOUR, "uuid": self.uuid,
+                    "index": index, "wild_colour": random.choice(COLOURS),
+                })
+            if (await self.request({"type": RequestType.PLAY, "uuid": self.uuid, "index": index}))["status"] == "done":
+                return
+        await self.request({"type": RequestType.DRAW, "uuid": self.uuid})
+
+
+class Table:
+    """One room of bots playing a single game."""
+    room_id: str
+    stats: Stats
+    trigger: tuple[str, float]
+
+    def __init__(self, room_id: str, players: int, stats: Stats):
+        self.room_id = room_id
+        self.stats = stats
+        self.bots = [Bot(self, f"bot-{i}") for i in range(players)]
+        self.trigger = (RequestType.JOIN, time.perf_counter())
+        self.done = asyncio.Event()
+
+    async def play(self, port: int):
+        try:
+            for bot in self.bots:
+                await bot.connect(port)
+            for bot in self.bots:
+                await bot.join()
+            await self.bots[0].request({"type": RequestType.START_GAME})
+            await asyncio.wait_for(self.done.wait(), GAME_TIMEOUT)
+            self.stats.games += 1
+        except (asyncio.TimeoutError, ConnectionError):
+            self.stats.errors += 1
+        finally:
+            for bot in self.bots:
+                if hasattr(bot, "writer"):
+                    bot.close()
+
+
+async def seat(port: int, index: int, players: int, deadline: float, stats: Stats):
+    game = 0
+    while time.perf_counter() < deadline:
+        await Table(f"load-{index}-{game}", players, stats).play(port)
+        game += 1
+
+async def generate(port: int, tables: int, players: int, seconds: float) -> dict:
+    stats = Stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(seat(port, i, players, start + seconds, stats) for i in range(tables)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "tables": tables,
+        "players": players,
+        "seconds": elapsed,
+        "games": stats.games,
+        "errors": stats.errors,
+        "requests_per_second": stats.sent / elapsed,
+        "messages_per_second": (stats.sent + stats.received) / elapsed,
+        "requests": summary(stats.requests),
+        "broadcasts": summary(stats.broadcasts),
+    }
+
+
+def wait_for_server(port: int, timeout: float = 10):
+    async def attempt():
+        _, writer = await asyncio.open_connection(HOST, port)
+        writer.close()
+
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return asyncio.run(attempt())
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.05)
+
+def report(results: dict):
+    print(f"{results['tables']} tables of {results['players']} bots for {results['seconds']:.1f}s: "
+          f"{results['games']} games, {results['errors']} errors")
+    print(f"{results['requests_per_second']:.0f} requests/s, {results['messages_per_second']:.0f} messages/s")
+    for kind in ("requests", "broadcasts"):
+        print(f"\n{kind} (ms) {'count':>10} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for request_type, row in results[kind].items():
+            print(f"{request_type:<16} {row['count']:>10} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['p99']:>8.2f}")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=250, help="concurrent rooms")
+    parser.add_argument("--players", type=int, default=4, help="bots per room")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, help="load a server already listening on this port")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the started server")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    port = args.port
+    if port is None:
+        port = 60200
+        server = subprocess.Popen(
+            [sys.executable, "__init__.py", "--workers", str(args.workers), "--host", HOST, "--port", str(port)],
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        wait_for_server(port)
+        results = asyncio.run(generate(port, args.tables, args.players, args.seconds))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report(results)
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
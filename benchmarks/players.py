@@ -0,0 +1,47 @@
+"""Measures per-message player lookup and turn order cost as the table grows.
+
+Run from the repository root:  python -m benchmarks.players
+"""
+import timeit
+
+from game import Game, Player
+from server.base import BroadcastManager
+
+SIZES = (2, 10, 200)
+
+
+def table(size: int) -> Game:
+    game = Game()
+    game.broadcast_manager = BroadcastManager()
+    for i in range(size):
+        game.add_player(Player(f"player-{i}", game.deck))
+    game.start()
+    return game
+
+
+def main(number: int = 20000):
+    print(f"{'players':>8}{'lookup hex':>14}{'lookup UUID':>14}{'query_hand':>14}{'advance':>14}{'leave+join':>14}")
+    for size in SIZES:
+        game = table(size)
+        last = list(game.players)[-1]
+        hex, uuid = last.uuid.hex, last.uuid
+        request = {"type": "query_hand", "uuid": hex}
+
+        def churn():
+            player = game.get_player_by_uuid(hex)
+            game.remove_player(player)
+            game.add_player(player)
+
+        results = [
+            timeit.timeit(lambda: game.get_player_by_uuid(hex), number=number),
+            timeit.timeit(lambda: game.get_player_by_uuid(uuid), number=number),
+            timeit.timeit(lambda: game.process(request), number=number),
+            timeit.timeit(lambda: game.seating.advance(game.direction), number=number),
+        ]
+        game.ongoing = False
+        results.append(timeit.timeit(churn, number=number))
+        print(f"{size:>8}" + "".join(f"{t / number * 1e9:>12.0f}ns" for t in results))
+
+
+if __name__ == "__main__":
+    main()
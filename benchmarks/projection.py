@@ -0,0 +1,69 @@
+"""Measures bytes sent per broadcast event as the table grows, with private fields only
+going to their owner.
+
+Run from the repository root:  python -m benchmarks.projection
+"""
+from game import Game, Player
+from server.base import BroadcastManager
+from server.protocol import JSON, BINARY
+
+SIZES = (2, 4, 10, 50, 100)
+
+
+class CountingOutbox:
+    """Stands in for a client connection and counts what would be written to it."""
+    def __init__(self, codec, owner: bytes):
+        self.codec = codec
+        self.owner = owner
+        self.sent = 0
+
+    def put(self, data: bytes) -> bool:
+        self.sent += len(data)
+        return True
+
+
+def measure(size: int, codec) -> dict[str, float]:
+    game = Game()
+    game.broadcast_manager = BroadcastManager()
+    for i in range(size):
+        player = Player(f"player-{i}", game.deck)
+        game.add_player(player)
+        game.broadcast_manager.subscribe(CountingOutbox(codec, player.uuid.bytes))
+    outboxes = game.broadcast_manager.outboxes
+
+    def sent() -> int:
+        total = sum(outbox.sent for outbox in outboxes)
+        for outbox in outboxes:
+            outbox.sent = 0
+        return total
+
+    results = {}
+    game.start()
+    results["game_start"] = sent()
+
+    # what game_start cost when every hand went to every player
+    results["game_start (all hands)"] = size * len(codec.encode({
+        "type": "game_start",
+        "players": {player.uuid.hex: {"hand": player.hand.as_data(), "index": player.seat, "name": player.name} for player in game.players},
+        "current_player": {"index": game.player_index, "uuid": game.current_player().uuid},
+        "top_card": game.pile.top_card(),
+    }))
+
+    game.process({"type": "draw", "uuid": game.current_player().uuid.hex})
+    results["draw"] = sent()
+    return results
+
+
+def main():
+    for codec in (JSON, BINARY):
+        print(f"{codec.name}: total bytes sent per event")
+        rows = {size: measure(size, codec) for size in SIZES}
+        events = list(rows[SIZES[0]])
+        print(f"{'players':>8}" + "".join(f"{event:>24}" for event in events))
+        for size, results in rows.items():
+            print(f"{size:>8}" + "".join(f"{results[event]:>24,}" for event in events))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compares the JSON and framed binary wire formats: bytes per turn and encode/decode time.
+
+Run from the repository root:  python -m benchmarks.protocol [turns]
+"""
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Optional
+
+from game import Game, Player
+from server.base import BroadcastManager
+from server.protocol import JSON, BINARY
+
+
+class RecordingBroadcastManager(BroadcastManager):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def broadcast(self, data: dict, private: Optional[dict[bytes, dict]] = None):
+        self.messages.append(data)
+
+    def broadcast_batch(self, events: list[tuple[dict, Optional[dict[bytes, dict]]]]):
+        self.messages.append({"type": "batch", "events": [data for data, _ in events]})
+
+
+def record_turns(turns: int) -> list[list[object]]:
+    """Plays a headless game, returning the requests, responses and broadcasts of each turn."""
+    game = Game()
+    game.broadcast_manager = RecordingBroadcastManager()
+    for name in ("Luna", "Rose", "Skye", "Iris"):
+        game.add_player(Player(name, game.deck))
+    game.start()
+
+    recorded = []
+    with redirect_stdout(StringIO()):
+        for _ in range(turns):
+            if not game.ongoing or len(game.deck) < 8:
+                break
+            game.broadcast_manager.messages.clear()
+            player = game.current_player()
+            request = {"type": "draw", "uuid": player.uuid, "message_uuid": player.uuid.hex}
+            for index, card in enumerate(player.hand.cards):
+                if game.pile.is_valid(card):
+                    if card.wild_colour is None and card.colour == "wild":
+                        card.wild_colour = "red"
+                    request = {"type": "play", "uuid": player.uuid, "index": index, "message_uuid": player.uuid.hex}
+                    break
+            response = {**game.process(request), "type": "response", "responding_to": request["message_uuid"]}
+            recorded.append([request, response, *game.broadcast_manager.messages])
+    return recorded
+
+
+def measure(codec, turns: list[list[object]], repeat: int) -> tuple[float, float, float]:
+    messages = [message for turn in turns for message in turn]
+    encoded = [codec.encode(message) for message in messages]
+    size = sum(map(len, encoded)) / len(turns)
+
+    # binary frames carry a 4-byte length prefix which the reader strips before decoding
+    bodies = encoded if codec is JSON else [frame[4:] for frame in encoded]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            codec.encode(message)
+    encode_time = (time.perf_counter() - start) / repeat / len(turns)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            codec.decode(body)
+    decode_time = (time.perf_counter() - start) / repeat / len(turns)
+
+    return size, encode_time, decode_time
+
+
+def main(turns: int = 60, repeat: int = 200):
+    recorded = record_turns(turns)
+    print(f"turns recorded: {len(recorded)}")
+    print(f"{'mode':<8}{'bytes/turn':>12}{'encode us/turn':>16}{'decode us/turn':>16}")
+    for codec in (JSON, BINARY):
+        size, encode_time, decode_time = measure(codec, recorded, repeat)
+        print(f"{codec.name:<8}{size:>12.1f}{encode_time * 1e6:>16.2f}{decode_time * 1e6:>16.2f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
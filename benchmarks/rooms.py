@@ -0,0 +1,71 @@
+"""Measures how many concurrent rooms one server process can hold and how many
+messages per second it can dispatch across them.
+
+Run from the repository root:  python -m benchmarks.rooms [rooms] [rounds]
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from server.rooms import RoomRegistry
+from server.server import Connection, process, unbind
+
+
+def encode(data: dict) -> bytes:
+    return json.dumps(data).encode() + b"\n"
+
+
+def main(n_rooms: int = 5000, rounds: int = 20):
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+
+    rooms = RoomRegistry()
+    tables = []
+
+    start = time.perf_counter()
+    for i in range(n_rooms):
+        connection = Connection()
+        room_id = f"room-{i}"
+        uuids = []
+        for name in ("Luna", "Rose"):
+            response = json.loads(process(encode({"type": "join", "name": name, "room": room_id}), rooms, connection)[:-1])
+            uuids.append(response["uuid"])
+        process(encode({"type": "start_game"}), rooms, connection)
+        tables.append((connection, uuids))
+    created = time.perf_counter() - start
+
+    live = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    messages = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for connection, uuids in tables:
+            game = connection.room.game
+            current = game.current_player().uuid.hex
+            process(encode({"type": "query_hand", "uuid": current}), rooms, connection)
+            process(encode({"type": "query_top_card"}), rooms, connection)
+            process(encode({"type": "draw", "uuid": current}), rooms, connection)
+            messages += 3
+    elapsed = time.perf_counter() - start
+
+    for connection, _ in tables:
+        unbind(rooms, connection)
+    tables.clear()
+    gc.collect()
+    residual = sys.getallocatedblocks() - blocks
+
+    print(f"rooms:            {n_rooms}")
+    print(f"room setup:       {created * 1e6 / n_rooms:.1f} us/room (under tracemalloc)")
+    print(f"memory live:      {live / n_rooms / 1024:.1f} KiB/room ({live / 2**20:.1f} MiB total)")
+    print(f"messages:         {messages}")
+    print(f"throughput:       {messages / elapsed:,.0f} msg/s")
+    print(f"rooms left:       {len(rooms)}")
+    print(f"blocks retained:  {residual}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,89 @@
+"""Measures end-to-end throughput of the sharded server as worker processes are added.
+
+For each worker count the server is started as a subprocess, then several client processes
+each open many connections, every one joining its own room and sending query_hand requests
+one at a time. The total requests answered per second is reported per worker count.
+
+Run from the repository root:  python -m benchmarks.sharded [max workers] [seconds]
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+HOST = "127.0.0.1"
+CONNECTIONS = 64 # per client process
+
+
+def encode(data: dict) -> bytes:
+    return json.dumps(data).encode() + b"\n"
+
+
+async def player(port: int, room_id: str, deadline: float) -> int:
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(encode({"type": "join", "name": "Luna", "room": room_id}))
+    uuid = json.loads(await reader.readline())["uuid"]
+    request = encode({"type": "query_hand", "uuid": uuid})
+
+    answered = 0
+    while time.perf_counter() < deadline:
+        writer.write(request)
+        await reader.readline()
+        answered += 1
+    writer.close()
+    return answered
+
+async def clients(port: int, client: int, seconds: float) -> int:
+    deadline = time.perf_counter() + seconds
+    counts = await asyncio.gather(*(
+        player(port, f"room-{client}-{i}", deadline) for i in range(CONNECTIONS)
+    ))
+    return sum(counts)
+
+def run_client(args: tuple[int, int, float]) -> int:
+    return asyncio.run(clients(*args))
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection((HOST, port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"server did not start on port {port}")
+
+def measure(workers: int, port: int, client_processes: int, seconds: float) -> float:
+    server = subprocess.Popen(
+        [sys.executable, "__init__.py", "--workers", str(workers), "--host", HOST, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        with Pool(client_processes) as pool:
+            answered = pool.map(run_client, [(port, i, seconds) for i in range(client_processes)])
+    finally:
+        server.terminate()
+        server.wait()
+    return sum(answered) / seconds
+
+
+def main(max_workers: int = 4, seconds: float = 3):
+    print(f"{os.cpu_count()} cpus")
+    print(f"{'workers':>8} {'msgs/s':>10}")
+    workers = 1
+    port = 60100
+    while workers <= max_workers:
+        rate = measure(workers, port, max(2, workers), seconds)
+        print(f"{workers:>8} {rate:>10.0f}")
+        workers *= 2
+        port += 1
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]), *(float(arg) for arg in sys.argv[2:3]))
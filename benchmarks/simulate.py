@@ -0,0 +1,176 @@
+"""Compares the vectorised simulator with games played through Game.process: games per
+second, and the statistics both produce under the same random policy, which should agree
+to within sampling error.
+
+With --verify, it instead checks the simulator's rules against Game's turn by turn: each
+seeded game is loaded into a one-row simulator, both play the same first-legal moves, and
+their positions are compared after every turn. The two shuffle recycled discards with
+different random generators, so after a turn that recycles only the sizes of hands and
+the deck are compared, and the simulator is loaded from the game again.
+
+Run from the repository root:  python -m benchmarks.simulate [--verify] [games] [players]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from bot import move
+from deck import Colour, COLOURS, FACE_COUNT
+from game import Game, Player
+from server.base import BroadcastManager
+from simulate import Simulator, DECK_FACES, PLAYABLE_TABLE, first_legal, random_legal
+
+MAX_TURNS = 2000
+
+
+def play(game: Game, rng: random.Random) -> int:
+    """Plays a game to the end with a uniformly random legal face, returning its length in turns."""
+    turns = 0
+    while not game.finished:
+        player = game.current_player()
+        uuid = player.uuid.hex
+        faces = {player.hand.cards[index].face: index for index in player.hand.legal_moves(game.pile)}
+        turns += 1
+        if not faces:
+            game.process({"type": "draw", "uuid": uuid})
+            continue
+        index = faces[rng.choice(list(faces))]
+        if player.hand.cards[index].colour == Colour.WILD:
+            counts = [sum(card.colour == colour for card in player.hand.cards) for colour in COLOURS]
+            game.process({"type": "set_wild_colour", "uuid": uuid, "index": index,
+                          "wild_colour": COLOURS[counts.index(max(counts))].value})
+        game.process({"type": "play", "uuid": uuid, "index": index})
+    return turns
+
+def engine(games: int, players: int) -> tuple[float, float, float]:
+    rng = random.Random(1)
+    lengths = []
+    first = 0
+    start = time.perf_counter()
+    for seed in range(games):
+        game = Game(seed=seed)
+        game.broadcast_manager = BroadcastManager()
+        for i in range(players):
+            game.add_player(Player(f"player-{i}", game.deck))
+        game.start()
+        seat_zero = game.current_player()
+        lengths.append(play(game, rng))
+        first += not seat_zero.hand.cards
+    return games / (time.perf_counter() - start), sum(lengths) / games, first / games
+
+def simulator(games: int, players: int) -> tuple[float, float, float]:
+    start = time.perf_counter()
+    sim = Simulator(games, players, seed=1)
+    sim.run([random_legal])
+    rate = games / (time.perf_counter() - start)
+    won = sim.winner >= 0
+    return rate, float(sim.turns[won].mean()), float(np.mean(sim.winner[won] == 0))
+
+
+def load(game: Game) -> Simulator:
+    """A one-row simulator in the position of game, with seats in the game's seat order."""
+    players = list(game.players)
+    sim = Simulator.empty(1, len(players), game.deck.decks)
+    ids = np.array(game.deck.ids, dtype=np.int64)
+    sim.deck[0, :len(ids)] = DECK_FACES[ids]
+    sim.deck_len[0] = len(ids)
+    for seat, player in enumerate(players):
+        sim.hands[0, seat] = np.bincount([card.face for card in player.hand.cards], minlength=FACE_COUNT)
+    sim.discards[0] = np.bincount(DECK_FACES[np.array(game.pile.discards, dtype=np.int64)], minlength=FACE_COUNT)
+    sim.top[0] = game.pile.top.face
+    sim.state[0] = game.pile.state
+    sim.direction[0] = game.direction
+    sim.current[0] = players.index(game.current_player())
+    return sim
+
+FIELDS = ("hands", "deck", "top", "state", "direction", "current", "winner")
+
+def position(game: Game, sim: Simulator, exact: bool) -> tuple[tuple, tuple]:
+    """The positions of game and sim to compare, as FIELDS: every hand's counts per face and
+    the deck's faces when exact, otherwise just the hand and deck sizes."""
+    players = list(game.players)
+    winner = next((seat for seat, player in enumerate(players) if not player.hand.cards), -1)
+    if exact:
+        hands = tuple(tuple(np.bincount([card.face for card in player.hand.cards], minlength=FACE_COUNT).tolist()) for player in players)
+        sim_hands = tuple(map(tuple, sim.hands[0].tolist()))
+        deck, sim_deck = tuple(DECK_FACES[np.array(game.deck.ids, dtype=np.int64)].tolist()), tuple(sim.deck[0, :sim.deck_len[0]].tolist())
+    else:
+        hands = tuple(len(player.hand.cards) for player in players)
+        sim_hands = tuple(sim.hands[0].sum(axis=1).tolist())
+        deck, sim_deck = len(game.deck.ids), int(sim.deck_len[0])
+    current = players.index(game.current_player()) if game.ongoing else -1
+    sim_current = -1 if sim.finished[0] else int(sim.current[0])
+    return (
+        (hands, deck, game.pile.top.face, game.pile.state, game.direction, current, winner),
+        (sim_hands, sim_deck, int(sim.top[0]), int(sim.state[0]), int(sim.direction[0]), sim_current, int(sim.winner[0])),
+    )
+
+def difference(expected: tuple, actual: tuple) -> str:
+    parts = []
+    for name, ours, theirs in zip(FIELDS, expected, actual):
+        if ours == theirs:
+            continue
+        if name == "hands":
+            seats = [seat for seat, (hand, sim_hand) in enumerate(zip(ours, theirs)) if hand != sim_hand]
+            parts.append(f"hands of seats {seats} differ")
+        elif name == "deck":
+            parts.append("decks differ")
+        else:
+            parts.append(f"{name} {ours} in Game, {theirs} in Simulator")
+    return "; ".join(parts)
+
+def verify(games: int = 200, players: int = 4) -> int:
+    """Plays seeded games through Game and the simulator in lockstep, reporting the first
+    turn at which each pair disagrees. Returns the number of games that disagreed."""
+    mismatched = turns = recycles = 0
+    for seed in range(games):
+        game = Game(seed=seed)
+        for i in range(players):
+            game.add_player(Player(f"player-{i}", game.deck))
+        game.start()
+        sim = load(game)
+
+        for turn in range(MAX_TURNS):
+            if game.finished:
+                break
+            player = game.current_player()
+            legal = sorted({player.hand.cards[index].face for index in player.hand.legal_moves(game.pile)})
+            sim_legal = np.flatnonzero(PLAYABLE_TABLE[sim.state[0]] & (sim.hands[0, sim.current[0]] > 0)).tolist()
+            if legal != sim_legal:
+                print(f"seed {seed} turn {turn}: legal faces {legal} in Game, {sim_legal} in Simulator")
+                mismatched += 1
+                break
+
+            # both name the colour they hold most of for a wild, breaking ties in COLOURS order
+            before = sim.recycles
+            game.process(move(player, legal[0] if legal else -1))
+            sim.step([first_legal])
+            recycled = sim.recycles > before
+            turns += 1
+
+            expected, actual = position(game, sim, exact=not recycled)
+            if expected != actual:
+                print(f"seed {seed} turn {turn}: {difference(expected, actual)}")
+                mismatched += 1
+                break
+            if recycled:
+                recycles += 1
+                sim = load(game)
+
+    print(f"{games} games of {players} players, {turns} turns compared ({recycles} after recycling): {mismatched} mismatched")
+    return mismatched
+
+def main(games: int = 2000, players: int = 4):
+    print(f"{games} games of {players} players")
+    print(f"{'':<10}{'games/s':>10}{'turns':>8}{'seat 0 wins':>13}")
+    for name, run in (("Game", engine), ("Simulator", simulator)):
+        rate, turns, first = run(games, players)
+        print(f"{name:<10}{rate:>10.0f}{turns:>8.1f}{first:>13.1%}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--verify"]:
+        sys.exit(1 if verify(*map(int, sys.argv[2:4])) else 0)
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,329 @@
+"""Built-in bot players, seated with an add_bot request to fill empty seats.
+
+A bot picks its move by determinized Monte Carlo: the cards it cannot see (the opponents'
+hands and the deck) are dealt at random consistently with what it does know (its own hand,
+the discards, the top card and every hand's size), and each legal face is tried as the
+first move of many such deals, played out to the end by the vectorised Simulator. The face
+that wins most often is played.
+
+Every decision has a hard wall-clock budget. Rollouts are run in batches sized from the
+rollout speed the bot measured on earlier turns, and a rollout still going when the budget
+runs out is abandoned and not counted. Budgets long enough to repay the overhead are spread
+over a process pool, which is only started when the server's bot budget is that long. When
+bots have spent more than their share of the last second thinking, a bot falls back to a
+cheap heuristic instead, so a busy server stays responsive."""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Optional
+
+import numpy as np
+
+from deck import CARD_FACE, COLOURS, FACE_COUNT, WILD_FACE, PLAYABLE_MASK, Colour
+from game import ALREADY_STARTED, Game, Player, PLAYER_KINDS, requests
+from server.base import RequestType
+from server.metrics import METRICS
+from simulate import Simulator, DECK_FACES, FACE_EFFECT, FACE_COLOURS, DRAW_FOUR, DRAW_TWO, SKIP, REVERSE, random_legal
+
+BUDGET = 0.02 # seconds per decision
+POOL_BUDGET = 0.1 # budgets at least this long are spread over the process pool
+THINKING_SHARE = 0.25 # of each second that bots may spend on rollouts before falling back
+MAX_TURNS = 500 # rollouts still going after this many turns are abandoned
+MAX_DEALS = 4096 # deals per batch
+
+SHOE_FACES = np.bincount(DECK_FACES, minlength=FACE_COUNT).astype(np.int16)
+
+
+class Governor:
+    """Tracks the time bots spent thinking over the last second across this process. Bots
+    think on several threads, so every access holds the lock."""
+    window: float
+    share: float
+    spent: deque
+
+    def __init__(self, share: float = THINKING_SHARE, window: float = 1.0):
+        self.share = share
+        self.window = window
+        self.spent = deque()
+        self._total = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self.spent and self.spent[0][0] < now - self.window:
+            self._total -= self.spent.popleft()[1]
+
+    def saturated(self) -> bool:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._total >= self.share * self.window
+
+    def record(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self.spent.append((now, seconds))
+            self._total += seconds
+
+
+GOVERNOR = Governor()
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def start_bots(budget: float = BUDGET, processes: int = 1):
+    """Sets the time every bot in this process may spend on a decision. Servers call this
+    once as they start. If the budget is long enough to spread over a process pool, it
+    also starts the pool, with this process's share of the cores (processes is how many
+    server processes share them) less one for the server itself.
+
+    The pool's workers are forked from a fork server, since forking the server itself
+    would copy its threads' locks in whatever state they were in."""
+    global _pool
+    BotPlayer.budget = budget
+    workers = (os.cpu_count() or 1) // processes - 1
+    if _pool is None and budget >= POOL_BUDGET and workers >= 1:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        _pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_ignore_interrupts)
+        # workers start on demand; start them now rather than during the first decisions
+        for _ in range(workers):
+            _pool.submit(int)
+
+def stop_bots():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def pool() -> Optional[ProcessPoolExecutor]:
+    """The process pool for rollouts, if start_bots() has started one."""
+    return _pool
+
+
+class Position:
+    """What a bot knows when it is its turn, in the Simulator's terms: seats are numbered
+    from the bot (seat 0) in turn order."""
+    hand: np.ndarray     # the bot's counts per face
+    unseen: np.ndarray   # faces of the cards in the opponents' hands and the deck
+    sizes: list[int]     # hand sizes of the opponents, from seat 1
+    discards: np.ndarray # counts per face
+    top: int
+    state: int
+    direction: int
+    decks: int
+
+    def __init__(self, game: Game, player: Player):
+        players = list(game.players)
+        first = players.index(player)
+        players = players[first:] + players[:first]
+
+        self.hand = np.bincount([card.face for card in player.hand.cards], minlength=FACE_COUNT).astype(np.int16)
+        self.discards = np.bincount(np.frombuffer(CARD_FACE, dtype=np.uint8)[list(game.pile.discards)], minlength=FACE_COUNT).astype(np.int16)
+        self.top = game.pile.top.face
+        self.state = game.pile.state
+        self.direction = game.direction
+        self.decks = game.deck.decks
+        self.sizes = [len(other.hand.cards) for other in players[1:]]
+
+        unseen = SHOE_FACES * self.decks - self.hand - self.discards
+        unseen[self.top] -= 1
+        self.unseen = np.repeat(np.arange(FACE_COUNT, dtype=np.uint8), unseen)
+
+    def candidates(self) -> list[int]:
+        """The faces the bot can play."""
+        mask = PLAYABLE_MASK[self.state]
+        return [face for face in np.flatnonzero(self.hand) if mask >> face & 1]
+
+
+def deal(sim: Simulator, position: Position, deals: int, candidates: list[int]):
+    """Lays out `deals` random deals of the unseen cards, each repeated once per candidate,
+    in the first rows of sim. Any rows after them are marked finished, so they are skipped."""
+    rows = deals * len(candidates)
+    shuffled = np.repeat(sim.rng.permuted(np.tile(position.unseen, (deals, 1)), axis=1), len(candidates), axis=0)
+    every = np.arange(rows)
+
+    sim.hands[:rows] = 0
+    sim.hands[:rows, 0] = position.hand
+    offset = 0
+    for seat, size in enumerate(position.sizes, 1):
+        for column in range(offset, offset + size):
+            sim.hands[every, seat, shuffled[:, column]] += 1
+        offset += size
+    rest = shuffled.shape[1] - offset
+    sim.deck[:rows, :rest] = shuffled[:, offset:]
+    sim.deck_len[:rows] = rest
+
+    sim.discards[:rows] = position.discards
+    sim.top[:rows] = position.top
+    sim.state[:rows] = position.state
+    sim.direction[:rows] = position.direction
+    sim.current[:rows] = 0
+    sim.turns[:] = 0
+    sim.finished[:rows] = False
+    sim.finished[rows:] = True
+    sim.winner[:] = -1
+
+def play_out(sim: Simulator, candidates: list[int], deadline: float) -> tuple[np.ndarray, np.ndarray]:
+    """Plays each row's candidate first, then random legal moves, until every row is over or
+    the deadline passes. Returns the wins and finished rollouts of each candidate."""
+    first = np.resize(np.array(candidates, dtype=np.int64), sim.games)
+
+    def forced(sim: Simulator, games: np.ndarray, legal: np.ndarray):
+        colours = (sim.hands[games, 0] @ FACE_COLOURS).argmax(axis=1)
+        return first[games], colours
+
+    sim.step([forced])
+    while not sim.finished.all() and time.monotonic() < deadline:
+        sim.step([random_legal])
+        sim.finished[sim.turns >= MAX_TURNS] = True
+
+    done = sim.winner >= 0
+    column = np.arange(sim.games) % len(candidates)
+    return (
+        np.bincount(column[sim.winner == 0], minlength=len(candidates)),
+        np.bincount(column[done], minlength=len(candidates)),
+    )
+
+def rollouts(position: Position, candidates: list[int], deals: int, deadline: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Runs one batch of rollouts; called in pool workers."""
+    sim = Simulator.empty(deals * len(candidates), len(position.sizes) + 1, position.decks, seed)
+    deal(sim, position, deals, candidates)
+    return play_out(sim, candidates, deadline)
+
+
+def favourite_colour(player: Player) -> Colour:
+    counts = [sum(card.colour == colour for card in player.hand.cards) for colour in COLOURS]
+    return COLOURS[counts.index(max(counts))]
+
+def move(player: Player, face: int) -> dict:
+    """The request that plays a card of face from the player's hand, or draws for face -1.
+    Wild cards are given the player's favourite colour."""
+    uuid = player.uuid.hex
+    if face < 0:
+        return {"type": RequestType.DRAW, "uuid": uuid}
+    index = next(i for i, card in enumerate(player.hand.cards) if card.face == face)
+    if face < WILD_FACE:
+        return {"type": RequestType.PLAY, "uuid": uuid, "index": index}
+    return {"type": RequestType.BATCH, "uuid": uuid, "operations": [
+        {"type": RequestType.SET_WILD_COLOUR, "index": index, "wild_colour": favourite_colour(player).value},
+        {"type": RequestType.PLAY, "index": index},
+    ]}
+
+def heuristic(game: Game, player: Player, candidates: list[int]) -> int:
+    """Picks a face without searching: attack when the following player is close to winning,
+    otherwise shed number cards first and keep wild cards for last."""
+    following = game.seating.following(game.direction)
+    if len(following.hand.cards) <= 2:
+        order = (DRAW_FOUR, DRAW_TWO, SKIP, REVERSE)
+        attacks = [face for face in candidates if FACE_EFFECT[face] in order]
+        if attacks:
+            return min(attacks, key=lambda face: order.index(FACE_EFFECT[face]))
+    return min(candidates, key=lambda face: (face >= WILD_FACE, FACE_EFFECT[face] != 0, face))
+
+def fallback(game: Game, player: Player) -> dict:
+    """The heuristic's move, or a draw; for a room to make when a bot failed to choose."""
+    candidates = sorted({player.hand.cards[index].face for index in player.hand.legal_moves(game.pile)})
+    return move(player, heuristic(game, player, candidates) if candidates else -1)
+
+
+class BotPlayer(Player):
+    """A player with no connection; the room moves for it whenever it is its turn."""
+    kind = 1
+    budget: float = BUDGET
+    # rollout speed measured on earlier decisions, in seconds per rollout turn
+    turn_seconds: float = 2e-6
+    rng: Optional[np.random.Generator] = None
+    _sim: Optional[Simulator] = None
+
+    def simulator(self, rows: int, players: int, decks: int) -> Simulator:
+        """A simulator with at least the given rows, reusing the arrays of earlier batches
+        when they fit. Rows are allocated in powers of two, so batch sizes that vary from
+        turn to turn (and shrink as the budget runs out) rarely need new arrays."""
+        sim = self._sim
+        if sim is None or sim.games < rows or sim.players != players or sim.decks != decks:
+            if self.rng is None:
+                self.rng = np.random.default_rng()
+            sim = self._sim = Simulator.empty(1 << (rows - 1).bit_length(), players, decks)
+            sim.rng = self.rng
+        return sim
+
+    def search(self, position: Position, candidates: list[int], budget: float) -> int:
+        """Runs rollouts until the budget is spent and returns the candidate that won most."""
+        start = time.monotonic()
+        deadline = start + budget
+        wins = np.zeros(len(candidates), dtype=np.int64)
+        played = np.zeros(len(candidates), dtype=np.int64)
+        # a rollout lasts about this many turns, counting every seat
+        length = 4 * sum(position.sizes) + 4 * int(position.hand.sum())
+
+        executor = pool() if budget >= POOL_BUDGET else None
+        if executor is not None:
+            deals = min(MAX_DEALS, max(1, int(budget / (self.turn_seconds * length * len(candidates)))))
+            futures = [
+                executor.submit(rollouts, position, candidates, deals, deadline, int(seed))
+                for seed in np.random.default_rng().integers(1 << 32, size=executor._max_workers)
+            ]
+            done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+            for future in pending:
+                future.cancel()
+            for future in done:
+                batch_wins, batch_played = future.result()
+                wins += batch_wins
+                played += batch_played
+        else:
+            while True:
+                remaining = deadline - time.monotonic()
+                deals = min(MAX_DEALS, int(remaining / (self.turn_seconds * length * len(candidates))))
+                if deals < 1:
+                    break
+                sim = self.simulator(deals * len(candidates), len(position.sizes) + 1, position.decks)
+                batch_start = time.monotonic()
+                deal(sim, position, deals, candidates)
+                batch_wins, batch_played = play_out(sim, candidates, deadline)
+                wins += batch_wins
+                played += batch_played
+                turns = int(sim.turns.sum())
+                if turns:
+                    measured = (time.monotonic() - batch_start) / turns
+                    self.turn_seconds = 0.7 * self.turn_seconds + 0.3 * measured
+
+        GOVERNOR.record(time.monotonic() - start)
+        if not played.any():
+            return -1
+        return candidates[int(np.argmax(wins / np.maximum(played, 1)))]
+
+    def choose(self, game: Game) -> dict:
+        """The request for this bot's move; it must be this bot's turn."""
+        position = Position(game, self)
+        candidates = position.candidates()
+        if not candidates:
+            return move(self, -1)
+
+        face = candidates[0]
+        if len(candidates) > 1:
+            METRICS.count("bot_decisions")
+            if GOVERNOR.saturated():
+                METRICS.count("bot_fallbacks")
+                face = heuristic(game, self, candidates)
+            else:
+                face = self.search(position, candidates, self.budget)
+                if face < 0:
+                    face = heuristic(game, self, candidates)
+        return move(self, face)
+
+PLAYER_KINDS[BotPlayer.kind] = BotPlayer
+
+
+@requests.handles(RequestType.ADD_BOT, name=str)
+def _add_bot(game: Game, data: dict, _) -> dict:
+    if game.ongoing:
+        return ALREADY_STARTED
+    bot = BotPlayer(data["name"], game.deck)
+    game.add_player(bot)
+    return {"status": "done", "uuid": bot.uuid}
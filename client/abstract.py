@@ -1,7 +1,15 @@
-from asyncio import open_connection, StreamReader, StreamWriter
-import json
-from uuid import uuid4 as uuid
-from ..deck import Card
+from asyncio import open_connection, create_task, Future, Queue, Task, StreamReader, StreamWriter, IncompleteReadError, get_running_loop
+from uuid import uuid4 as uuid, UUID
+from typing import Optional
+from deck import Card, PLAYABLE, FACE_COUNT, EMPTY_STATE
+from server.protocol import JSON, BINARY, MAGIC
+
+
+def _hex(player_uuid: str | UUID) -> str:
+    """Player uuids arrive as hex strings over JSON and as UUIDs over the binary protocol."""
+    return player_uuid.hex if isinstance(player_uuid, UUID) else player_uuid
+
+
 class Game:
 
     """
@@ -12,11 +20,10 @@ class Game:
     - other names and card counts
     - order of play
 
-
-    Accept broadcasts:
-    - if uuid present, only if uuid = self.uuid
-    
-    
+    All of it is kept current from broadcasts, so reads are answered locally rather than
+    by query requests. The server is only asked again, with a snapshot request, when the
+    local state is found to have diverged: a broadcast is missed, or a count it carries
+    does not match what is held here.
     """
 
     uuid: str
@@ -24,33 +31,78 @@ class Game:
     initiated: bool
     game_started: bool
     hand: list[Card]
-    players: list[(str, str, int)] #(uuid, name, cards)
-    top_card: Card
-    current_player: str
+    players: list[list] #[uuid, name, cards]
+    top_card: Optional[Card]
+    current_player: Optional[str]
+    winner: Optional[str]
+    seq: int
+    resyncing: bool
+    held: list[dict] # broadcasts received while resyncing
 
-    def __init__(self, player_name: str):
+    def __init__(self, player_name: str, codec = JSON):
         self.name = player_name
 
-        self.connection_manager: ConnectionManager = ConnectionManager(self)
-        self.connection_manager.connect(("127.0.0.1", 60001))
+        self.connection_manager: ConnectionManager = ConnectionManager(self, codec)
         self.initiated = False
         self.game_started = False
+        self.hand = []
+        self.players = []
+        self.top_card = None
+        self.current_player = None
+        self.winner = None
+        self.seq = 0
+        self.resyncing = False
+        self.held = []
 
-    def on_connection(self):
-        response = json.loads(self.connection_manager.sendrecv({"type": "join", "name": self.name}))
-        self.uuid = response['uuid']
+    async def connect(self, server: tuple[str, int] = ("127.0.0.1", 60001), room: Optional[str] = None):
+        await self.connection_manager.connect(server)
+        request = {"type": "join", "name": self.name}
+        if room is not None:
+            request["room"] = room
+        response = await self.connection_manager.request(request)
+        self.uuid = _hex(response['uuid'])
         self.initiated = True
 
-    def _handle_turn_start(self):
-        self._handle_hand(json.loads(self.connection_manager.sendrecv({"type":"query_hand", "uuid": self.uuid}))['cards'])
+    def legal_moves(self) -> list[int]:
+        """The indices of the cards in the hand that can be played on the top card."""
+        state = EMPTY_STATE if self.top_card is None else self.top_card.state
+        return [index for index, card in enumerate(self.hand) if PLAYABLE[state * FACE_COUNT + card.face]]
+
+    def names(self) -> list[str]:
+        """The names of the other players in seat order, as query_names returns them."""
+        return [name for player_uuid, name, _ in self.players if player_uuid != self.uuid]
+
+    def card_counts(self) -> list[int]:
+        """The card counts of the other players in seat order, as query_card_counts returns them."""
+        return [count for player_uuid, _, count in self.players if player_uuid != self.uuid]
+
+    async def play(self, index: int, wild_colour: Optional[str] = None) -> dict:
+        """Plays a card. A wild card's colour is set in the same batch, so both happen or neither does."""
+        if wild_colour is None:
+            return await self.connection_manager.request({"type": "play", "uuid": self.uuid, "index": index})
+
+        card = self.hand[index]
+        response = await self.connection_manager.request({"type": "batch", "uuid": self.uuid, "operations": [
+            {"type": "set_wild_colour", "index": index, "wild_colour": wild_colour},
+            {"type": "play", "index": index},
+        ]})
+        if response['status'] == "done":
+            card.wild_colour = wild_colour
+        return response
+
+    async def draw(self) -> dict:
+        return await self.connection_manager.request({"type": "draw", "uuid": self.uuid})
+
+    def on_turn(self):
         # wait for input, either play or draw
-        
+        pass
 
     def _handle_current_player_broadcast(self, data: dict):
-        self.current_player = data['current_player']['uuid']
+        self.current_player = _hex(data['current_player']['uuid'])
 
         if self.current_player == self.uuid:
-            self._handle_turn_start()
+            # the hand and top card are already current, so the turn starts without a query
+            self.on_turn()
 
     def _handle_top_card_broadcast(self, data: dict):
         self.top_card = Card.from_data(data['top_card'])
@@ -58,68 +110,189 @@ class Game:
     def _handle_hand(self, hand: list):
         self.hand = list(map(lambda x: Card.from_data(x), hand))
 
-    def _handle_card_counts(self, data: dict):
+    def _handle_players(self, players: dict):
+        self.players = list(map(lambda x: [x[0], x[1]['name'], x[1]['count']], players.items()))
+
+    def _handle_count(self, data: dict) -> bool:
+        """Records a player's card count. Returns False if the player is unknown or the count
+        disagrees with the hand held here."""
+        player_uuid = _hex(data['uuid'])
+        if player_uuid == self.uuid and data['count'] != len(self.hand):
+            return False
         for i in self.players:
-            i[2] = data['card_counts'][i[0]]
+            if i[0] == player_uuid:
+                i[2] = data['count']
+                return True
+        return False
+
+    def _handle_card_added(self, data: dict) -> bool:
+        if _hex(data['uuid']) == self.uuid:
+            if 'cards' not in data:
+                return False
+            self.hand.extend(map(lambda x: Card.from_data(x), data['cards']))
+        return self._handle_count(data)
+
+    def _handle_card_removed(self, data: dict) -> bool:
+        if _hex(data['uuid']) == self.uuid:
+            if not 0 <= data['index'] < len(self.hand):
+                return False
+            # the server moves the last card of the hand into the removed card's place
+            last = self.hand.pop()
+            if data['index'] < len(self.hand):
+                self.hand[data['index']] = last
+        return self._handle_count(data)
+
+    def _handle_player_left(self, data: dict):
+        player_uuid = _hex(data['uuid'])
+        self.players = [player for player in self.players if player[0] != player_uuid]
+
+    def _handle_snapshot(self, data: dict):
+        self.resyncing = False
+        state = data['state']
+        self.seq = data['seq']
+        self.game_started = state['ongoing']
+        self._handle_players(state['players'])
+        self._handle_hand(state['hand'])
+        if state['top_card'] is not None:
+            self._handle_top_card_broadcast(state)
+        if state['current_player'] is not None:
+            self._handle_current_player_broadcast(state)
+        held, self.held = self.held, []
+        for event in held:
+            self.process(event)
+
+    def resync(self):
+        """Asks for a snapshot. Broadcasts received meanwhile are held until it arrives: those
+        it already includes are then skipped by their seq, and the rest are applied, since the
+        server may send events of later requests ahead of the snapshot's response."""
+        self.resyncing = True
+        self.held = []
+        self.connection_manager.send({"type": "snapshot", "uuid": self.uuid}, in_band=True)
 
     def process(self, data: dict):
-        if data['type'] == "game_start":
-            self.players = list(map(lambda x: (x[0], x[1]['name'], len(data['hand'])), data['players'].items()))
-            self._handle_hand(data['players'][self.uuid]['hand'])
-            self._handle_top_card_broadcast()
-            self._handle_current_player_broadcast(data)
+        if data['type'] == "response":
+            if 'state' in data:
+                self._handle_snapshot(data)
             return
-        
-        if 'top_card' in data:
-            self._handle_top_card_broadcast(data)
 
-        if 'current_player' in data:
-            self._handle_current_player_broadcast(data)
+        if self.resyncing:
+            self.held.append(data)
+            return
+
+        if 'seq' in data:
+            if data['seq'] <= self.seq:
+                return
+            if data['seq'] != self.seq + 1:
+                self.resync()
+                return
+            self.seq = data['seq']
 
-        if 'cards' in data:
-            self._handle_hand(data['cards'])    
+        consistent = True
+        match data['type']:
+            case "game_start":
+                self.game_started = True
+                self._handle_players(data['players'])
+                self._handle_hand(data['hand'])
+                self._handle_top_card_broadcast(data)
+                self._handle_current_player_broadcast(data)
+            case "top_card":
+                self._handle_top_card_broadcast(data)
+            case "turn":
+                self._handle_current_player_broadcast(data)
+            case "card_added":
+                consistent = self._handle_card_added(data)
+            case "card_removed":
+                consistent = self._handle_card_removed(data)
+            case "player_left":
+                self._handle_player_left(data)
+            case "batch":
+                for event in data['events']:
+                    self.process(event)
+            case "game_end":
+                self.game_started = False
+                self.winner = None if data['winner'] is None else _hex(data['winner']['uuid'])
 
-        if 'card_counts' in data:
-            self._handle_card_counts(data)
+        if not consistent:
+            self.resync()
 
 class ConnectionManager:
+    """A connection to the server that can have many requests in flight.
 
+    Every request is tagged with a message_uuid and gets a future, resolved by the
+    response that echoes it in responding_to. Everything else the server sends is a
+    broadcast; broadcasts are queued in arrival order and handed to the game by run()."""
     reader: StreamReader
     writer: StreamWriter
     game: Game
-    def __init__(self, game: Game):
+    codec: object
+    pending: dict[str, Future]
+    broadcasts: Queue
+    in_band: set[str]
+
+    def __init__(self, game: Game, codec = JSON):
         self.game = game
+        self.codec = codec
+        self.pending = {}
+        self.broadcasts = Queue()
+        self.in_band = set()
+        self._listener: Optional[Task] = None
 
-    def process(self, data: bytes):
-        try:
-            info = json.loads(data)
-        except json.decoder.JSONDecodeError:
-            print("Invalid JSON")
-            return
-        
-        if 'uuid' in info and info['uuid'] != self.game.uuid:
-            return
-        
-        self.game.process(info)
+    async def connect(self, server: tuple[str, int]):
+        self.reader, self.writer = await open_connection(*server)
+        if self.codec is BINARY:
+            self.writer.write(MAGIC)
+            if await self.reader.readexactly(len(MAGIC)) != MAGIC:
+                raise ConnectionError("server does not speak the binary protocol")
+        self._listener = create_task(self._listen())
 
-    def send(self, data: object):
-        b['message_uuid'] = uuid().hex
-        b = json.dumps(data).encode()
+    def send(self, data: dict, in_band: bool = False) -> Future:
+        """Sends a request without waiting, returning the future of its response.
 
-        self.writer.write(b)
+        With in_band, the response is also queued with the broadcasts, so it is handled in
+        order with them."""
+        message_uuid = uuid().hex
+        future = get_running_loop().create_future()
+        self.pending[message_uuid] = future
+        if in_band:
+            self.in_band.add(message_uuid)
 
-    def sendrecv(self, data: object) -> bytes:
-        self.send(data)
-        return self.reader.readuntil()
+        self.writer.write(self.codec.encode({**data, "message_uuid": message_uuid}))
+        return future
 
-    async def connect(self, server: tuple[str, int]):
-        connection = await open_connection(*server)
-        self.reader: StreamReader = connection[0] 
-        self.writer: StreamWriter = connection[1]
+    async def request(self, data: dict) -> dict:
+        return await self.send(data)
 
-        while True:
-            d = await self.reader.readuntil()
+    async def _listen(self):
+        try:
+            while True:
+                data = self.codec.decode(await self.codec.read(self.reader))
+                if data.get('type') == "response" and data.get('responding_to') in self.pending:
+                    message_uuid = data['responding_to']
+                    future = self.pending.pop(message_uuid)
+                    if not future.done():
+                        future.set_result(data)
+                    if message_uuid not in self.in_band:
+                        continue
+                    self.in_band.discard(message_uuid)
+                self.broadcasts.put_nowait(data)
+        except (IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self.pending.clear()
+            self.broadcasts.put_nowait(None)
+
+    async def run(self):
+        """Hands broadcasts to the game until the connection closes."""
+        while (data := await self.broadcasts.get()) is not None:
             try:
-                self.process(d)
+                self.game.process(data)
             except Exception as e:
-                print(e)
\ No newline at end of file
+                print(e)
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        self.writer.close()
@@ -1,6 +1,8 @@
 from enum import StrEnum
 import re
 from typing import Callable, Optional
+from array import array
+from collections import deque
 import random
 
 
@@ -39,21 +41,124 @@ def pretty(inner: Callable[..., str]) -> Callable[..., str]:
     return wrapper
 
 
+COLOURS: tuple[Colour, ...] = (Colour.RED, Colour.GREEN, Colour.BLUE, Colour.YELLOW)
+
+# A face is a distinct (colour, value) pair: 52 coloured faces followed by the 2 wild faces.
+FACES: tuple[tuple[Colour, ColourValue | WildValue], ...] = (
+    *((colour, value) for colour in COLOURS for value in ColourValue),
+    *((Colour.WILD, value) for value in WildValue),
+)
+FACE_COUNT = len(FACES)
+WILD_FACE = FACE_COUNT - len(WildValue)
+FACE_INDEX: dict[tuple[Colour, ColourValue | WildValue], int] = {face: index for index, face in enumerate(FACES)}
+
+# Every physical card in a standard deck gets an id from 0 to 107; identical cards differ only by id.
+CARD_FACE: bytes = bytes(
+    [FACE_INDEX[colour, value] for colour in COLOURS for value in ColourValue for _ in range(1 if value == ColourValue.ZERO else 2)]
+    + [FACE_INDEX[Colour.WILD, value] for value in WildValue for _ in range(4)]
+)
+CARD_COUNT = len(CARD_FACE)
+FIRST_ID: tuple[int, ...] = tuple(CARD_FACE.index(face) for face in range(FACE_COUNT))
+WILD_ID = FIRST_ID[WILD_FACE]
+# A packed card is its id, or for a wild card with a colour chosen, one of 4 values per wild id after the ids.
+PACKED_COUNT = CARD_COUNT + (CARD_COUNT - WILD_ID) * 4
+
+# A card code is the face, or for a wild card with a colour chosen, one of 4 codes per wild face after the faces.
+CODE_COUNT = FACE_COUNT + len(WildValue) * len(COLOURS)
+
+# The top of a pile is one of these states: a coloured face, a wild card of a chosen colour,
+# a wild card with no colour chosen, or an empty pile.
+WILD_STATE = WILD_FACE
+UNCOLOURED_WILD_STATE = WILD_STATE + len(COLOURS)
+EMPTY_STATE = UNCOLOURED_WILD_STATE + 1
+STATE_COUNT = EMPTY_STATE + 1
+
+def _playable(state: int, face: int) -> bool:
+    if state == EMPTY_STATE or face >= WILD_FACE:
+        return True
+    colour, value = FACES[face]
+    if state == UNCOLOURED_WILD_STATE:
+        return False
+    if state >= WILD_STATE:
+        return colour == COLOURS[state - WILD_STATE]
+    top_colour, top_value = FACES[state]
+    return colour == top_colour or value == top_value
+
+# PLAYABLE[state * FACE_COUNT + face] says whether face can be played on state.
+PLAYABLE: bytes = bytes(_playable(state, face) for state in range(STATE_COUNT) for face in range(FACE_COUNT))
+# PLAYABLE_MASK[state] has bit `face` set for every face that can be played on state.
+PLAYABLE_MASK: tuple[int, ...] = tuple(
+    sum(1 << face for face in range(FACE_COUNT) if PLAYABLE[state * FACE_COUNT + face]) for state in range(STATE_COUNT)
+)
+
+
 class Card:
+    __slots__ = ("id", "face", "colour", "value", "wild_colour")
+
+    id: int
+    face: int
     colour: Colour
     value: ColourValue | WildValue
     wild_colour: Optional[Colour]
 
-    def __init__(self, colour: Colour, value: WildValue | ColourValue):
+    def __init__(self, colour: Colour, value: WildValue | ColourValue, id: Optional[int] = None):
         if colour == Colour.WILD:
             assert type(value) == WildValue
         else:
             assert type(value) == ColourValue
 
+        self.face = FACE_INDEX[colour, value]
+        self.id = FIRST_ID[self.face] if id is None else id
         self.value = value
         self.colour = colour
         self.wild_colour = None
 
+    def from_id(id: int) -> "Card":
+        """Returns the card with an id. Coloured cards are immutable, so one shared instance is
+        returned per id; wild cards get a fresh instance because their wild colour is set in play."""
+        if CARD_FACE[id] >= WILD_FACE:
+            return Card(*FACES[CARD_FACE[id]], id)
+        return CARDS[id]
+
+    @property
+    def state(self) -> int:
+        """The pile state this card produces when it is the top card."""
+        if self.face < WILD_FACE:
+            return self.face
+        if self.wild_colour is None:
+            return UNCOLOURED_WILD_STATE
+        return WILD_STATE + COLOURS.index(self.wild_colour)
+
+    @property
+    def code(self) -> int:
+        """A compact code (below CODE_COUNT) for the face and chosen wild colour of this card."""
+        if self.wild_colour is None:
+            return self.face
+        return FACE_COUNT + (self.face - WILD_FACE) * len(COLOURS) + COLOURS.index(self.wild_colour)
+
+    @property
+    def packed(self) -> int:
+        """A byte holding both the id and the chosen wild colour of this card."""
+        if self.wild_colour is None:
+            return self.id
+        return CARD_COUNT + (self.id - WILD_ID) * len(COLOURS) + COLOURS.index(self.wild_colour)
+
+    def from_packed(packed: int) -> "Card":
+        if packed < CARD_COUNT:
+            return Card.from_id(packed)
+        id, colour = divmod(packed - CARD_COUNT, len(COLOURS))
+        card = Card.from_id(WILD_ID + id)
+        card.wild_colour = COLOURS[colour]
+        return card
+
+    def from_code(code: int) -> "Card":
+        if code < FACE_COUNT:
+            return Card.from_id(FIRST_ID[code])
+        face, colour = divmod(code - FACE_COUNT, len(COLOURS))
+        card = Card.from_id(FIRST_ID[WILD_FACE + face])
+        card.wild_colour = COLOURS[colour]
+        return card
+
     def __repr__(self):
         return f"Card<{self.colour.name}, {self.value.name}>"
 
@@ -76,10 +181,19 @@ class Card:
         return f"{colour[self.colour]}{self.value}\033[00m"
     
     def __eq__(self, __value: object):
-        if not isinstance(object, Card):
+        if not isinstance(__value, Card):
             return False
         
-        return self.value == self.value and self.colour == self.colour
+        return self.face == __value.face
+
+    def __hash__(self):
+        return self.face
+
+    def as_data(self) -> dict:
+        data = {"value": self.value, "colour": self.colour}
+        if self.wild_colour is not None:
+            data["wild_colour"] = self.wild_colour
+        return data
 
     def from_data(data):
         card = Card(Colour(data['colour']), (WildValue if data['colour'] == Colour.WILD else ColourValue)(data['value']))
@@ -87,25 +201,87 @@ class Card:
             card.wild_colour = data['wild_colour']
         return card
 
+CARDS: tuple[Card, ...] = tuple(Card(*FACES[face], id) for id, face in enumerate(CARD_FACE))
+DECK_IDS = array('B', range(CARD_COUNT))
+
+
 class Deck:
-    cards: list[Card] = []
-
-    def __init__(self):
-        self.cards = []
-        for colour in Colour:
-            if colour == Colour.WILD:
-                for value in WildValue:
-                    for i in range (4):
-                        self.cards.append(Card(colour, value))
-                continue
-
-            for value in ColourValue:
-                self.cards.append(Card(colour, value))
-                if value != ColourValue.ZERO:
-                    self.cards.append(Card(colour, value))
+    """The draw stack (a shoe of one or more standard decks), held as an array of card ids.
+    Cards are only materialised when drawn.
+
+    Shuffles are reproducible: the nth shuffle of a deck is driven by a generator seeded
+    from the deck's seed and n, so a seed and a shuffle count fully describe its randomness."""
+    ids: array
+    decks: int
+    seed: int
+    shuffles: int
+
+    def __init__(self, decks: int = 1, seed: Optional[int] = None):
+        self.ids = DECK_IDS * decks
+        self.decks = decks
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.shuffles = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rng(self) -> random.Random:
+        """Returns the generator for the next shuffle."""
+        self.shuffles += 1
+        return random.Random(self.seed << 32 | self.shuffles)
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.rng().shuffle(self.ids)
+
+    def add_deck(self):
+        """Shuffles another standard deck into the shoe."""
+        self.ids.extend(DECK_IDS)
+        self.decks += 1
+        self.shuffle()
+
+    def recycle(self, ids: array):
+        """Shuffles discarded cards back into the draw stack, beneath the cards still in it."""
+        ids = array('B', ids)
+        self.rng().shuffle(ids)
+        self.ids[:0] = ids
     
     def draw(self, n: int = 1) -> list[Card]:
-        return [self.cards.pop() for i in range(n)]
\ No newline at end of file
+        pop = self.ids.pop
+        return [Card.from_id(pop()) for i in range(n)]
+
+
+class ShufflePool:
+    """Single decks shuffled ahead of time, for new games to take instead of shuffling when
+    a room is created. Each deck gets its own seed and is shuffled exactly as a new Deck is,
+    so a game dealt from the pool is reproducible from its seed like any other.
+
+    The pool starts with no capacity, and then every take() misses."""
+    decks: deque[Deck]
+    size: int
+    misses: int
+
+    def __init__(self, size: int = 0):
+        self.decks = deque()
+        self.size = size
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.decks)
+
+    def fill(self, n: int) -> int:
+        """Shuffles up to n more decks, stopping at the pool's size. Returns the number shuffled."""
+        n = max(0, min(n, self.size - len(self.decks)))
+        for _ in range(n):
+            deck = Deck()
+            deck.shuffle()
+            self.decks.append(deck)
+        return n
+
+    def take(self) -> Optional[Deck]:
+        if self.decks:
+            return self.decks.popleft()
+        if self.size:
+            self.misses += 1
+        return None
+
+SHUFFLES = ShufflePool()
\ No newline at end of file
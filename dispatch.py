@@ -0,0 +1,80 @@
+from typing import Callable, Optional
+
+TYPE_NAMES = {int: "an integer", str: "a string", list: "a list", dict: "an object"}
+
+DONE = {"status": "done"}
+NO_ACTION = {"status": "no action"}
+
+def error(message: str) -> dict:
+    return {"status": "error", "message": message}
+
+# Responses are shared between requests; callers must copy them rather than add to them.
+TYPE_MISSING = error("type not specified.")
+TYPE_INVALID = error("invalid type.")
+UUID_MISSING = error("uuid not specified.")
+PLAYER_MISSING = error("player does not exist.")
+
+
+class Handler:
+    """A request handler and the schema its request is validated against before it is called."""
+    __slots__ = ("method", "player", "checks")
+
+    method: Callable
+    player: bool
+    checks: tuple[tuple[str, type, dict, dict], ...]
+
+    def __init__(self, method: Callable, player: bool, fields: dict[str, type]):
+        self.method = method
+        self.player = player
+        self.checks = tuple(
+            (name, kind, error(f"{name} not specified."), error(f"{name} must be {TYPE_NAMES[kind]}."))
+            for name, kind in fields.items()
+        )
+
+
+class Dispatcher:
+    """Routes requests to handlers by their type.
+
+    Handlers are registered with the `handles` decorator, declaring the fields their request
+    must carry and whether it names a player by uuid. Validation and player lookup happen
+    here once, so handlers only contain the behaviour of their request."""
+    handlers: dict[str, Handler]
+
+    def __init__(self):
+        self.handlers = {}
+
+    def handles(self, request_type: str, player: bool = False, **fields: type):
+        def decorator(method: Callable) -> Callable:
+            self.handlers[request_type] = Handler(method, player, fields)
+            return method
+        return decorator
+
+    def dispatch(self, target, data: dict) -> dict:
+        """Validates a request and calls its handler with the target and the player it names (if any)."""
+        request_type = data.get("type")
+        if request_type is None:
+            return TYPE_MISSING
+        try:
+            handler = self.handlers.get(request_type)
+        except TypeError:
+            handler = None
+        if handler is None:
+            return TYPE_INVALID
+
+        player: Optional[object] = None
+        if handler.player and "uuid" not in data:
+            return UUID_MISSING
+
+        for name, kind, missing, invalid in handler.checks:
+            value = data.get(name)
+            if value is None:
+                return missing
+            if type(value) is not kind:
+                return invalid
+
+        if handler.player:
+            player = target.get_player_by_uuid(data["uuid"])
+            if player is None:
+                return PLAYER_MISSING
+
+        return handler.method(target, data, player)
@@ -1,107 +1,300 @@
 from pile import Pile
-from deck import Deck, Card, Colour, ColourValue, WildValue
+from deck import Deck, Card, Colour, ColourValue, WildValue, SHUFFLES
 from hand import Hand
+from seating import Seating
 from typing import Optional
 from uuid import uuid4 as uuid, UUID
+from struct import Struct
+from array import array
 from server.base import RequestType, BroadcastManager
+from dispatch import Dispatcher, DONE, NO_ACTION, error
+
+requests = Dispatcher()
+
+HAND_SIZE = 7
+
+INDEX_OUT_OF_RANGE = error("card index out of range.")
+PLAY_FAILED = error("play action failed.")
+CANNOT_PLAY = error("card cannot be played.")
+DRAW_FAILED = error("draw action failed.")
+WILD_COLOUR_WILD = error("wild_colour cannot be wild.")
+WILD_COLOUR_INVALID = error("invalid wild_colour.")
+NOT_WILD = error("specified card is not wild.")
+NOT_RUNNING = error("game not running.")
+ALREADY_STARTED = error("game already started.")
+OPERATION_INVALID = error("operations must be objects.")
+
+# joins are journaled with the uuid they were given, which a batch has no way to record
+UNBATCHABLE = frozenset((RequestType.JOIN, RequestType.ADD_BOT, RequestType.BATCH))
+
+WILD_COLOURS = {colour.value: colour for colour in Colour if colour != Colour.WILD}
+
+SNAPSHOT_VERSION = 1
+# version, seed, shuffles, decks, seq, flags, next seat, current player, top card, deck size, discards, players
+_snapshot_header = Struct("!BQIHIBHHBIIH")
+# uuid, seat, flags (uno called, then the player kind above it), name length, hand size
+_snapshot_player = Struct("!16sHBHH")
+NO_PLAYER = 0xffff
+NO_CARD = 0xff
+ONGOING, FINISHED, REVERSED = 1, 2, 4
 
 class Player:
     name: str
     hand: Hand
     uuid: UUID
+    seat: int
 
     uno_called: bool
+    kind: int = 0 # PLAYER_KINDS key, kept in snapshots so restored players get their class back
 
-    def __init__(self, name: str, deck: Deck):
+    def __init__(self, name: str, deck: Deck, player_uuid: Optional[UUID] = None):
         self.name = name
         self.hand = Hand.from_deck(deck)
         self.uno_called = False
-        self.uuid = uuid()
+        self.uuid = uuid() if player_uuid is None else player_uuid
 
-    
+# Player subclasses register themselves here (see bot.py) so that restore() can rebuild them.
+PLAYER_KINDS: dict[int, type[Player]] = {Player.kind: Player}
 
 
 class Game:
     pile: Pile
     deck: Deck
-    players: list[Player]
+    seating: Seating
 
-    player_index: int = 0
     ongoing: bool = False
+    finished: bool = False
     direction: int = 1
+    seq: int = 0
+    batched: Optional[list[tuple[dict, Optional[dict]]]] = None # broadcasts held back during a batch
 
-    broadcast_manager: Optional[BroadcastManager]
+    broadcast_manager: Optional[BroadcastManager] # None for a headless game, whose broadcasts go nowhere
 
-    def __init__(self):
-        self.deck = Deck()
-        self.deck.shuffle()
+    def __init__(self, decks: int = 1, seed: Optional[int] = None):
+        # a new single-deck game takes a deck shuffled ahead of time when the pool has one
+        self.deck = SHUFFLES.take() if seed is None and decks == 1 else None
+        if self.deck is None:
+            self.deck = Deck(decks, seed)
+            self.deck.shuffle()
 
-        self.players = []
-        self.player_index = 0
+        self.seating = Seating()
         self.ongoing = False
+        self.finished = False
         self.direction = 1
+        self.seq = 0
 
         self.pile = Pile(self.deck.draw())
         self.broadcast_manager = None
 
+    def snapshot(self) -> bytes:
+        """Serialises the whole game into a compact, versioned binary image.
+
+        Cards are stored as Card.packed bytes and the deck's randomness as its seed and
+        shuffle count, so restore() reproduces the game exactly, including future shuffles.
+        The broadcast manager is not part of the image."""
+        players = list(self.players)
+        current = self.seating.current
+        top = self.pile.top_card()
+        flags = (self.ongoing and ONGOING) | (self.finished and FINISHED) | (self.direction < 0 and REVERSED)
+
+        parts = [
+            _snapshot_header.pack(
+                SNAPSHOT_VERSION, self.deck.seed, self.deck.shuffles, self.deck.decks, self.seq, flags,
+                self.seating.next_seat, NO_PLAYER if current is None else players.index(current),
+                NO_CARD if top is None else top.packed,
+                len(self.deck.ids), len(self.pile.discards), len(players)
+            ),
+            self.deck.ids.tobytes(),
+            self.pile.discards.tobytes(),
+        ]
+        for player in players:
+            name = player.name.encode()
+            parts.append(_snapshot_player.pack(player.uuid.bytes, player.seat, player.uno_called | player.kind << 1, len(name), len(player.hand.cards)))
+            parts.append(name)
+            parts.append(bytes(card.packed for card in player.hand.cards))
+        return b"".join(parts)
+
+    def restore(data: bytes) -> "Game":
+        """Rebuilds a game from an image made by snapshot()."""
+        view = memoryview(data)
+        (version, seed, shuffles, decks, seq, flags, next_seat, current, top,
+            deck_size, discard_size, player_count) = _snapshot_header.unpack_from(view)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        offset = _snapshot_header.size
+
+        game = Game.__new__(Game)
+        game.deck = Deck.__new__(Deck)
+        game.deck.ids = array('B')
+        game.deck.ids.frombytes(view[offset:offset + deck_size])
+        game.deck.decks, game.deck.seed, game.deck.shuffles = decks, seed, shuffles
+        offset += deck_size
+
+        game.pile = Pile()
+        game.pile.discards.frombytes(view[offset:offset + discard_size])
+        if top != NO_CARD:
+            game.pile.top = Card.from_packed(top)
+            game.pile.state = game.pile.top.state
+        offset += discard_size
+
+        game.seating = Seating()
+        players = []
+        for _ in range(player_count):
+            player_uuid, seat, player_flags, name_size, hand_size = _snapshot_player.unpack_from(view, offset)
+            offset += _snapshot_player.size
+            kind = PLAYER_KINDS[player_flags >> 1]
+            player = kind.__new__(kind)
+            player.uuid = UUID(bytes=player_uuid)
+            player.uno_called = bool(player_flags & 1)
+            player.name = str(view[offset:offset + name_size], "utf-8")
+            offset += name_size
+            player.hand = Hand(map(Card.from_packed, view[offset:offset + hand_size]))
+            offset += hand_size
+            game.seating.add(player, seat)
+            players.append(player)
+
+        if offset != len(view):
+            raise ValueError("Trailing bytes in snapshot")
+
+        game.seating.next_seat = next_seat
+        game.seating.current = None if current == NO_PLAYER else players[current]
+        game.ongoing = bool(flags & ONGOING)
+        game.finished = bool(flags & FINISHED)
+        game.direction = -1 if flags & REVERSED else 1
+        game.seq = seq
+        game.broadcast_manager = None
+        return game
+
     def add_player(self, player: Player):
         if self.ongoing:
             raise RuntimeError("Cannot join an ongoing game")
         
-        self.players.append(player)
+        self.seating.add(player)
+
+        if len(self.deck) < HAND_SIZE * 2:
+            # large tables get another deck in the shoe so that dealing never runs the deck dry
+            self.deck.add_deck()
+
+    @property
+    def seed(self) -> int:
+        return self.deck.seed
+
+    @property
+    def players(self) -> Seating:
+        """Every player in seat order."""
+        return self.seating
+
+    @property
+    def player_index(self) -> int:
+        """The seat of the player whose turn it is."""
+        current = self.seating.current
+        return 0 if current is None else current.seat
 
     def start(self):
-        assert not self.ongoing
+        assert not self.ongoing and not self.finished
+        assert len(self.seating) > 0
 
         self.ongoing = True
 
-        self.broadcast_manager.broadcast({
+        self.broadcast({
             "type": "game_start",
-            "players": dict(map(lambda arg: (lambda index, player: (player.uuid, {
-                "hand": player.hand.as_data(),
-                "index": index,
-                "name": player.name
-            }))(*arg), enumerate(self.players))),
+            "players": dict(map(lambda player: (player.uuid.hex, {
+                "index": player.seat,
+                "name": player.name,
+                "count": len(player.hand.cards)
+            }), self.players)),
             "current_player": {
                 "index": self.player_index,
                 "uuid": self.current_player().uuid
             },
+            "direction": self.direction,
             "top_card": self.pile.top_card(),
-        })
-
-    def increment(self):
-        self.player_index += self.direction
-        self.player_index %= len(self.players)
-
-        top_card = self.pile.top_card()
+        }, dict(map(lambda player: (player.uuid.bytes, {"hand": player.hand.as_data()}), self.players)))
+
+    def broadcast(self, data: dict, private: Optional[dict[bytes, dict]] = None):
+        """Stamps a broadcast with the next sequence number and sends it.
+
+        Broadcasts only describe what changed; a client that sees a gap in the sequence
+        numbers resynchronises with a snapshot request. Fields in private are keyed by
+        player uuid bytes and only reach that player."""
+        self.seq += 1
+        data["seq"] = self.seq
+        if self.batched is not None:
+            self.batched.append((data, private))
+            return
+        if self.broadcast_manager is not None:
+            self.broadcast_manager.broadcast(data, private)
 
-        self.broadcast_manager.broadcast({
-            "type": "broadcast",
+    def broadcast_batch(self, events: list[tuple[dict, Optional[dict]]]):
+        """Sends the broadcasts of a batch as one message, each event keeping its own seq."""
+        if self.broadcast_manager is None:
+            return
+        if len(events) == 1:
+            self.broadcast_manager.broadcast(*events[0])
+        else:
+            self.broadcast_manager.broadcast_batch(events)
+
+    def savepoint(self) -> tuple:
+        """Captures everything a batch's operations can change, for rollback(). Unlike a
+        snapshot it holds on to the players and cards themselves, so rolling back puts the
+        state back onto the objects that callers (and bots, with their rollout state) hold."""
+        top = self.pile.top
+        return (
+            [(player, list(player.hand.cards), [card.wild_colour for card in player.hand.cards], player.uno_called)
+             for player in self.seating],
+            self.seating.current, self.seating.next_seat,
+            array('B', self.deck.ids), self.deck.shuffles,
+            array('B', self.pile.discards), top, None if top is None else top.wild_colour, self.pile.state,
+            self.ongoing, self.finished, self.direction, self.seq,
+        )
+
+    def rollback(self, savepoint: tuple):
+        """Returns the game in place to a savepoint()."""
+        (players, current, next_seat, ids, shuffles, discards, top, top_colour, state,
+            self.ongoing, self.finished, self.direction, self.seq) = savepoint
+        self.seating.clear()
+        for player, cards, colours, uno_called in players:
+            for card, colour in zip(cards, colours):
+                card.wild_colour = colour
+            player.hand.replace(cards)
+            player.uno_called = uno_called
+            self.seating.add(player, player.seat)
+        self.seating.current, self.seating.next_seat = current, next_seat
+
+        self.deck.ids[:], self.deck.shuffles = ids, shuffles
+        self.pile.discards[:] = discards
+        self.pile.top, self.pile.state = top, state
+        if top is not None:
+            top.wild_colour = top_colour
+        self.batched = None
+
+    def increment(self, n: int = 1):
+        self.seating.advance(self.direction, n)
+
+        self.broadcast_current_player()
+
+    def broadcast_current_player(self):
+        self.broadcast({
+            "type": "turn",
             "current_player": {
                 "index": self.player_index,
                 "uuid": self.current_player().uuid
-            }
+            },
+            "direction": self.direction
         })
 
     def current_player(self) -> Player:
-        return self.players[self.player_index]
+        return self.seating.current
     
     def broadcast_pile(self):
-        self.broadcast_manager.broadcast({
-            "type": "broadcast",
+        self.broadcast({
+            "type": "top_card",
             "top_card": self.pile.top_card()
         })
 
-    def broadcast_card_counts(self):
-        self.broadcast_manager.broadcast({
-            "type": "broadcast",
-            "card_counts": dict(map(lambda player: (player.uuid, len(player.hand.cards)), self.players))
-        })
-
     def play(self, player: Player, index: Optional[int]):
         assert self.ongoing
-        assert player in self.players
-        assert self.players.index(player) == self.player_index
+        assert player is self.seating.current
 
         if index is None:
             self.give_player(player)
@@ -113,35 +306,64 @@ class Game:
 
         player.hand.play(index, self.pile)
 
+        self.broadcast({
+            "type": "card_removed",
+            "uuid": player.uuid,
+            "index": index,
+            "count": len(player.hand.cards)
+        })
         self.broadcast_pile()
 
+        if not player.hand.cards:
+            self.finish(player)
+            return
+
         card: Card = self.pile.top_card()
 
         if card.value in (WildValue.DRAW_4, ColourValue.DRAW_TWO):
-            self.increment()
-            self.give_player(n = 2 if card.value == ColourValue.DRAW_TWO else 4)
-            self.increment()
+            self.give_player(self.seating.following(self.direction), n = 2 if card.value == ColourValue.DRAW_TWO else 4)
+            self.increment(2)
             return
         
         if card.value == ColourValue.REVERSE:
             self.direction *= -1
 
         if card.value == ColourValue.SKIP:
-            self.increment()
-            self.increment()
+            self.increment(2)
             return
         
         self.increment()
 
+    def finish(self, winner: Optional[Player]):
+        """Ends the game; with no winner if every player has left."""
+        self.ongoing = False
+        self.finished = True
+
+        self.broadcast({
+            "type": "game_end",
+            "winner": None if winner is None else {
+                "uuid": winner.uuid,
+                "name": winner.name
+            }
+        })
+
     def give_player(self, player: Optional[Player] = None, n: int = 1):
         if player is None:
             player = self.current_player()
-        player.hand.cards.extend(self.deck.draw(n))
-        self.broadcast_manager.broadcast({
-            "type": "broadcast",
+        cards = self.draw(n)
+        player.hand.add(cards)
+        self.broadcast({
+            "type": "card_added",
             "uuid": player.uuid,
-            "cards": player.hand.as_data()
-        })
+            "count": len(player.hand.cards)
+        }, {player.uuid.bytes: {"cards": cards}})
+
+    def draw(self, n: int = 1) -> list[Card]:
+        """Draws up to n cards, recycling the discard pile into the deck if it runs out.
+        Fewer than n cards are returned only if every other card is in a hand."""
+        if len(self.deck) < n:
+            self.deck.recycle(self.pile.take_discards())
+        return self.deck.draw(min(n, len(self.deck)))
 
     def say_uno(self, player: Player):
         assert len(self.current_player().hand.cards) == 1
@@ -151,163 +373,191 @@ class Game:
         elif not self.current_player().uno_called:
             self.give_player(n=2)
     
-    def get_player_by_uuid(self, uuid: UUID) -> Optional[Player]:
-        for player in self.players:
-            if player.uuid.hex == uuid or player.uuid == uuid:
-                return player
-            
-        return None
+    def get_player_by_uuid(self, uuid: str | bytes | UUID) -> Optional[Player]:
+        return self.seating.get(uuid)
+
+    def remove_player(self, player: Player):
+        was_current = player is self.seating.current
+        self.seating.remove(player, self.direction)
+
+        if not self.ongoing:
+            return
+
+        self.broadcast({
+            "type": "player_left",
+            "uuid": player.uuid
+        })
+        if len(self.seating) <= 1:
+            # the last player wins, or, if the game was started alone, nobody does
+            self.finish(self.seating.current)
+        elif was_current:
+            self.broadcast_current_player()
     
     def process(self, data: dict) -> dict:
-        if 'type' not in data:
-            return {"status": "error", "message": "type not specified."}
-        
+        return requests.dispatch(self, data)
+
+    @requests.handles(RequestType.JOIN, name=str)
+    def _join(self, data: dict, _) -> dict:
+        # checked before the player is dealt their hand, which would change the deck
+        if self.ongoing:
+            return ALREADY_STARTED
+        p = Player(data["name"], self.deck)
+        self.add_player(p)
+        return {"status": "done", "uuid": p.uuid}
+
+    @requests.handles(RequestType.LEAVE, player=True)
+    def _leave(self, data: dict, player: Player) -> dict:
+        self.remove_player(player)
+        return DONE
+
+    @requests.handles(RequestType.START_GAME)
+    def _start_game(self, data: dict, _) -> dict:
+        try:
+            self.start()
+            return DONE
+        except AssertionError:
+            return NO_ACTION
+
+    @requests.handles(RequestType.CALL_UNO, player=True)
+    def _call_uno(self, data: dict, player: Player) -> dict:
+        try:
+            self.say_uno(player)
+            return DONE
+        except AssertionError:
+            return NO_ACTION
+
+    @requests.handles(RequestType.PLAY, player=True, index=int)
+    def _play(self, data: dict, player: Player) -> dict:
+        if not 0 <= data['index'] < len(player.hand.cards):
+            return INDEX_OUT_OF_RANGE
+
         try:
-            t = RequestType(data["type"])
+            self.play(player, data['index'])
+        except AssertionError:
+            return PLAY_FAILED
         except ValueError:
-            return {"status": "error", "message": "invalid type."}
-
-        match t:
-            case RequestType.JOIN:
-                p = Player(data["name"], self.deck)
-                self.add_player(p)
-                return {"status": "done", "uuid": p.uuid}
-            case RequestType.LEAVE:
-                if 'uuid' not in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                player = self.get_player_by_uuid(data["uuid"])
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-                self.players.remove(player)
-                return {"status": "done"}
-            case RequestType.START_GAME:
-                try:
-                    self.start()
-                    return {"status": "done"}
-                except AssertionError:
-                    return {"status": "no action"}
-            case RequestType.CALL_UNO:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                try:
-                    self.say_uno(self.get_player_by_uuid(data["uuid"]))
-                    return {"status": "done"}
-                except AssertionError:
-                    return {"status": "no action"}
-            case RequestType.PLAY:
-                if 'uuid' not in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                if 'index' not in data:
-                    return {"status": "error", "message": "index not specified."}
-                if type(data['index']) != int:
-                    return {"status": "error", "message": "index must be an integer."}
-
-                player = self.get_player_by_uuid(data['uuid'])
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-
-                if 0 > data['index'] or data['index'] > len(player.hand.cards):
-                    return {"status": "erorr", "message": "card index out of range."}
-                
-                try:
-                    self.play(player, data['index'])
-                except AssertionError:
-                    return {"status": "error", "message": "play action failed."}
-
-                return {"status": "done"}
-            case RequestType.DRAW:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                
-                player = self.get_player_by_uuid(data['uuid'])
-
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-
-                try:
-                    self.play(player, None)
-                except AssertionError:
-                    return {"status": "error", "message": "draw action failed."}
-                
-                return {"status": "done", "card": {"value": player.hand.cards[-1].value, "colour": player.hand.cards[-1].colour}}
-            case RequestType.SET_WILD_COLOUR:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                if 'index' not in data:
-                    return {"status": "error", "message": "index not specified."}
-                if type(data['index']) != int:
-                    return {"status": "error", "message": "index must be an integer."}
-                
-                if 'wild_colour' not in data:
-                    return {"status": "error", "message": "wild_colour not specified."}
-                try:
-                    wild_colour = Colour(data['wild_colour'])
-                    assert wild_colour != Colour.WILD
-                except AssertionError:
-                    return {"status": "error", "message": "wild_colour cannot be wild."}
-                except ValueError:
-                    return {"status": "error", "message": "invalid wild_colour."}
-                
-                player = self.get_player_by_uuid(data['uuid'])
-
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-                
-                if 0 > data['index'] or data['index'] > len(player.hand.cards):
-                    return {"status": "erorr", "message": "card index out of range."}
-
-                card = player.hand.cards[data['index']]
-
-                if card.colour != Colour.WILD:
-                    return {"status": "error", "message": "specified card is not wild."}
-                
-                card.wild_colour = wild_colour
-                return {"status": "done"}
-            case RequestType.QUERY_TOP_CARD:
-                if not self.ongoing:
-                    return {"status": "error", "message": "game not running."}
-                
-                card = self.pile.top_card()
-
-                if card is None:
-                    return {"status": "done", "card": {}}
-
-                return {"status": "done", "card": {
-                    "value": card.value,
-                    "colour": card.colour,
-                    "wild_colour": card.wild_colour
-                }}
-            case RequestType.QUERY_HAND:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                
-                player = self.get_player_by_uuid(data['uuid'])
-
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-                
-                return {"status": "done", "hand": player.hand.as_data()}
-            case RequestType.QUERY_NAMES:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                
-                player = self.get_player_by_uuid(data['uuid'])
-
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-                
-                return {"status": "done", "players": list(map(lambda p: p.name, filter(lambda p: p != player, self.players)))}
-            case RequestType.QUERY_CARD_COUNTS:
-                if not 'uuid' in data:
-                    return {"status": "error", "message": "uuid not specified."}
-                
-                player = self.get_player_by_uuid(data['uuid'])
-
-                if player is None:
-                    return {"status": "error", "message": "player does not exist."}
-                
-                return {"status": "done", "players": list(map(lambda p: len(p.hand.cards), filter(lambda p: p != player, self.players)))}
-        return {"status": "error", "message": "unknown"}
+            # raised by the pile before anything has changed
+            return CANNOT_PLAY
+
+        return DONE
+
+    @requests.handles(RequestType.DRAW, player=True)
+    def _draw(self, data: dict, player: Player) -> dict:
+        count = len(player.hand.cards)
+        try:
+            self.play(player, None)
+        except AssertionError:
+            return DRAW_FAILED
+
+        if len(player.hand.cards) == count:
+            return {"status": "done", "card": {}}
+        return {"status": "done", "card": player.hand.cards[-1].as_data()}
+
+    @requests.handles(RequestType.SET_WILD_COLOUR, player=True, index=int, wild_colour=str)
+    def _set_wild_colour(self, data: dict, player: Player) -> dict:
+        wild_colour = WILD_COLOURS.get(data['wild_colour'])
+        if wild_colour is None:
+            return WILD_COLOUR_WILD if data['wild_colour'] == Colour.WILD else WILD_COLOUR_INVALID
+
+        if not 0 <= data['index'] < len(player.hand.cards):
+            return INDEX_OUT_OF_RANGE
+
+        card = player.hand.cards[data['index']]
+
+        if card.colour != Colour.WILD:
+            return NOT_WILD
+
+        card.wild_colour = wild_colour
+        return DONE
+
+    @requests.handles(RequestType.BATCH, operations=list)
+    def _batch(self, data: dict, _) -> dict:
+        """Runs operations in order as one request. If any of them fails, the game is rolled
+        back to where it was before the batch and nothing is broadcast; otherwise their
+        broadcasts go out together. Operations without a uuid act as the batch's uuid.
+
+        Inside a caller's own batching (a room draining its queue), the broadcasts join the
+        caller's instead."""
+        savepoint = self.savepoint()
+        outer, self.batched = self.batched, []
+        results = []
+        try:
+            for operation in data['operations']:
+                if type(operation) is not dict:
+                    response = OPERATION_INVALID
+                elif type(operation.get("type")) is str and operation["type"] in UNBATCHABLE:
+                    response = error(f"{operation['type']} cannot be batched.")
+                else:
+                    if "uuid" in data and "uuid" not in operation:
+                        operation = {**operation, "uuid": data["uuid"]}
+                    response = requests.dispatch(self, operation)
+                results.append(response)
+
+                if response.get("status") == "error":
+                    self.rollback(savepoint)
+                    self.batched = outer
+                    return {
+                        "status": "error", "message": f"operation {len(results) - 1} failed; batch rolled back.",
+                        "index": len(results) - 1, "results": results,
+                    }
+        except BaseException:
+            self.rollback(savepoint)
+            self.batched = outer
+            raise
+
+        events, self.batched = self.batched, outer
+        if outer is not None:
+            outer.extend(events)
+        elif events:
+            self.broadcast_batch(events)
+        return {"status": "done", "results": results}
+
+    @requests.handles(RequestType.QUERY_TOP_CARD)
+    def _query_top_card(self, data: dict, _) -> dict:
+        if not self.ongoing:
+            return NOT_RUNNING
+
+        card = self.pile.top_card()
+
+        if card is None:
+            return {"status": "done", "card": {}}
+
+        return {"status": "done", "card": {
+            "value": card.value,
+            "colour": card.colour,
+            "wild_colour": card.wild_colour
+        }}
+
+    @requests.handles(RequestType.QUERY_HAND, player=True)
+    def _query_hand(self, data: dict, player: Player) -> dict:
+        return {"status": "done", "hand": player.hand.as_data(), "legal_moves": player.hand.legal_moves(self.pile)}
+
+    @requests.handles(RequestType.SNAPSHOT, player=True)
+    def _snapshot(self, data: dict, player: Player) -> dict:
+        current = self.current_player()
+        return {"status": "done", "seq": self.seq, "state": {
+            "ongoing": self.ongoing,
+            "direction": self.direction,
+            "current_player": None if current is None else {
+                "index": current.seat,
+                "uuid": current.uuid
+            },
+            "top_card": self.pile.top_card(),
+            "hand": player.hand.as_data(),
+            "players": dict(map(lambda p: (p.uuid.hex, {
+                "index": p.seat,
+                "name": p.name,
+                "count": len(p.hand.cards)
+            }), self.players)),
+        }}
+
+    @requests.handles(RequestType.QUERY_NAMES, player=True)
+    def _query_names(self, data: dict, player: Player) -> dict:
+        return {"status": "done", "players": list(map(lambda p: p.name, filter(lambda p: p != player, self.players)))}
+
+    @requests.handles(RequestType.QUERY_CARD_COUNTS, player=True)
+    def _query_card_counts(self, data: dict, player: Player) -> dict:
+        return {"status": "done", "players": list(map(lambda p: len(p.hand.cards), filter(lambda p: p != player, self.players)))}
 
 # Game loop:
 # - Turn (wait for player to play)
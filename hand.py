@@ -1,18 +1,70 @@
-from deck import Card, Deck
+from deck import Card, Deck, PLAYABLE_MASK
 from typing import Iterable, Optional, Self
 from pile import Pile
 from pick import pick
 
 class Hand:
+    """A player's cards, indexed by face.
+
+    `cards` keeps the positional order that play and set_wild_colour requests refer to.
+    Alongside it the hand keeps the positions of every face and a bitmask of the faces
+    held, so membership, removal and legal move enumeration do not scan the hand.
+
+    Removing a card moves the last card of the hand into its position; every other card
+    keeps its index."""
     cards: list[Card] = []
+    positions: dict[int, set[int]]
+    mask: int
 
     def __init__(self, cards: Optional[Iterable[Card]]):
         self.cards = []
+        self.positions = {}
+        self.mask = 0
         if cards is not None:
-            self.cards.extend(cards)
+            self.add(cards)
     
     def from_deck(deck: Deck, n: int = 7) -> Self:
         return Hand(deck.draw(n))
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def add(self, cards: Iterable[Card]) -> None:
+        positions = self.positions
+        for card in cards:
+            face = card.face
+            if face in positions:
+                positions[face].add(len(self.cards))
+            else:
+                positions[face] = {len(self.cards)}
+                self.mask |= 1 << face
+            self.cards.append(card)
+
+    def replace(self, cards: Iterable[Card]) -> None:
+        """Makes cards the whole hand, in order."""
+        self.cards.clear()
+        self.positions.clear()
+        self.mask = 0
+        self.add(cards)
+
+    def remove(self, index: int) -> Card:
+        """Removes the card at an index, moving the last card into its place."""
+        card = self.cards[index]
+        last = len(self.cards) - 1
+        positions = self.positions[card.face]
+        positions.remove(index)
+
+        if index != last:
+            moved = self.cards[last]
+            self.cards[index] = moved
+            self.positions[moved.face].remove(last)
+            self.positions[moved.face].add(index)
+        self.cards.pop()
+
+        if not positions:
+            del self.positions[card.face]
+            self.mask &= ~(1 << card.face)
+        return card
     
     def play(self, index: int, pile: Pile) -> None:
         """Plays a card at an index from the hand. """
@@ -20,7 +72,17 @@ class Hand:
             raise IndexError(f"Card does not exist at index {index}")
         
         pile.play(self.cards[index]) # such that if pile.play errors, the card does not leave the hand
-        self.cards.pop(index)
+        self.remove(index)
+
+    def legal_moves(self, pile: Pile) -> list[int]:
+        """Returns the indices of every card in the hand that can be played on the pile."""
+        moves = []
+        faces = self.mask & PLAYABLE_MASK[pile.state]
+        while faces:
+            face = (faces & -faces).bit_length() - 1
+            moves.extend(self.positions[face])
+            faces &= faces - 1
+        return moves
 
     def terminal_print(self):
         print(*map(lambda x:x.terminal_str(), self.cards), sep="\t")
@@ -32,7 +94,7 @@ class Hand:
         return (self.cards[index], index)
     
     def __contains__(self, a: Card) -> bool:
-        return a in self.cards
+        return self.mask >> a.face & 1 == 1
     
     def as_data(self) -> list[dict]:
-        return list(map(lambda card: {"value":card.value, "colour": card.colour}, self.cards))
\ No newline at end of file
+        return list(map(lambda card: {"value":card.value, "colour": card.colour}, self.cards))
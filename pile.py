@@ -1,40 +1,48 @@
-from deck import Card, Colour
-from typing import Iterable
+from deck import Card, PLAYABLE, FACE_COUNT, EMPTY_STATE
+from typing import Iterable, Optional
+from array import array
 
 class Pile:
-    cards: list[Card] = []
+    """The discard pile. Only the top card is kept as a Card; the cards beneath it are kept
+    as ids until they are recycled into the deck."""
+    top: Optional[Card]
+    discards: array
+    state: int
     def __init__(self, cards: Iterable[Card] = None):
-        self.cards = []
+        self.top = None
+        self.discards = array('B')
+        self.state = EMPTY_STATE
         if cards is not None:
-            self.cards.extend(cards)
+            for card in cards:
+                self.place(card)
     
+    def __len__(self) -> int:
+        return len(self.discards) + (self.top is not None)
+
     def top_card(self) -> Card | None:
         """Returns the top card on the deck. If the deck is empty, None is returned."""
-        try:
-            return self.cards[-1]
-        except IndexError:
-            return None
+        return self.top
     
     def is_valid(self, card: Card) -> bool:
         "Checks if it is valid to play a specified card on the deck."
-        top_card = self.top_card()
-        
-        if top_card is None:
-            return True
-        
-        if card.colour == Colour.WILD:
-            return True
-        
-        colour = top_card.wild_colour if top_card.colour == Colour.WILD else top_card.colour
-        if colour == card.colour:
-            return True
-        if top_card.colour == Colour.WILD:
-            return False
-        return card.value == top_card.value
+        return PLAYABLE[self.state * FACE_COUNT + card.face] == 1
     
     def play(self, card: Card) -> None:
         """Attempts to play a card on the pile. If the card cannot be played, an error is raised."""
         if not self.is_valid(card):
             raise ValueError("Card cannot be played")
         
-        self.cards.append(card)
\ No newline at end of file
+        self.place(card)
+
+    def place(self, card: Card) -> None:
+        """Puts a card on top of the pile without checking that it can be played."""
+        if self.top is not None:
+            self.discards.append(self.top.id)
+        self.top = card
+        self.state = card.state
+
+    def take_discards(self) -> array:
+        """Removes and returns the ids of every card beneath the top card."""
+        discards = self.discards
+        self.discards = array('B')
+        return discards
@@ -0,0 +1,109 @@
+from typing import Iterable, Optional, TYPE_CHECKING
+from uuid import UUID
+
+if TYPE_CHECKING:
+    from game import Player
+
+
+class Seating:
+    """The players of a game and the ring they take turns around.
+
+    Players are keyed by their UUID (as a UUID, its 16 bytes or its hex string) and linked
+    to their neighbours in join order, so lookup, advancing the turn and removal are all O(1).
+    Every player keeps the seat number they joined with; seats are never renumbered."""
+    by_hex: dict[str, "Player"]
+    by_bytes: dict[bytes, "Player"]
+    current: Optional["Player"]
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        """Unseats every player."""
+        self.by_hex = {}
+        self.by_bytes = {}
+        self.current = None
+        self._last = None
+        self._next = {}
+        self._prev = {}
+        self._seats = 0
+
+    def __len__(self) -> int:
+        return len(self.by_hex)
+
+    def __iter__(self) -> Iterable["Player"]:
+        """Iterates over the players in seat order."""
+        return iter(self.by_hex.values())
+
+    def __contains__(self, player: "Player") -> bool:
+        return player in self._next
+
+    def get(self, key: str | bytes | UUID) -> Optional["Player"]:
+        if isinstance(key, str):
+            return self.by_hex.get(key)
+        if isinstance(key, UUID):
+            return self.by_bytes.get(key.bytes)
+        if isinstance(key, bytes):
+            return self.by_bytes.get(key)
+        return None
+
+    @property
+    def next_seat(self) -> int:
+        """The seat number the next player to join will get."""
+        return self._seats
+
+    @next_seat.setter
+    def next_seat(self, seat: int):
+        self._seats = seat
+
+    def add(self, player: "Player", seat: Optional[int] = None) -> None:
+        """Seats a player after everyone who has already joined.
+
+        Players are given the next seat number unless one is passed, as when restoring a game."""
+        player.seat = self._seats if seat is None else seat
+        self._seats = max(self._seats, player.seat + 1)
+        self.by_hex[player.uuid.hex] = player
+        self.by_bytes[player.uuid.bytes] = player
+
+        if self.current is None:
+            self.current = self._last = player
+            self._next[player] = self._prev[player] = player
+            return
+
+        last = self._last
+        first = self._next[last]
+        self._next[last] = player
+        self._prev[player] = last
+        self._next[player] = first
+        self._prev[first] = player
+        self._last = player
+
+    def remove(self, player: "Player", direction: int = 1) -> None:
+        """Removes a player. If it was their turn, the turn passes to the following player in direction."""
+        del self.by_hex[player.uuid.hex]
+        del self.by_bytes[player.uuid.bytes]
+
+        next, prev = self._next.pop(player), self._prev.pop(player)
+        if next is player:
+            self.current = self._last = None
+            return
+
+        self._next[prev] = next
+        self._prev[next] = prev
+        if self._last is player:
+            self._last = prev
+        if self.current is player:
+            self.current = next if direction > 0 else prev
+
+    def following(self, direction: int = 1, player: Optional["Player"] = None) -> "Player":
+        """Returns the player whose turn follows player (by default the current player)."""
+        if player is None:
+            player = self.current
+        return self._next[player] if direction > 0 else self._prev[player]
+
+    def advance(self, direction: int = 1, n: int = 1) -> "Player":
+        """Passes the turn n players along in direction, returning the new current player."""
+        links = self._next if direction > 0 else self._prev
+        for _ in range(n):
+            self.current = links[self.current]
+        return self.current
@@ -1,5 +1,10 @@
 from enum import StrEnum
-from socket import socket
+from asyncio import StreamWriter, Event, CancelledError, get_running_loop
+from collections import deque
+from uuid import UUID
+from typing import Optional
+from deck import Card
+from .metrics import METRICS
 import json
 
 
@@ -15,15 +20,144 @@ class RequestType(StrEnum):
     QUERY_HAND = "query_hand"
     QUERY_CARD_COUNTS = "query_card_counts"
     QUERY_NAMES = "query_names"
+    SNAPSHOT = "snapshot"
+    METRICS = "metrics"
+    PROFILE = "profile"
+    BATCH = "batch"
+    ADD_BOT = "add_bot"
+
+
+class MessageEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, UUID):
+            return obj.hex
+        if isinstance(obj, Card):
+            return obj.as_data()
+        return json.JSONEncoder.default(self, obj)
+
+
+OUTBOX_LIMIT = 256 # messages a client may fall behind by before it is disconnected
+
+
+class Outbox:
+    """Bounded outbound queue for one client.
+
+    Writes happen on the outbox's own task and respect drain() backpressure, so a slow
+    socket only ever delays itself. A client that falls more than `limit` messages behind
+    is disconnected."""
+    writer: StreamWriter
+    codec: object
+    owner: Optional[bytes] # uuid bytes of the player this client plays as, if any
+    queue: deque[bytes]
+    limit: int
+    closed: bool
+
+    def __init__(self, writer: StreamWriter, codec, limit: int = OUTBOX_LIMIT):
+        self.writer = writer
+        self.codec = codec
+        self.owner = None
+        self.queue = deque()
+        self.limit = limit
+        self.closed = False
+        self._ready = Event()
+        self._task = get_running_loop().create_task(self._pump())
+
+    def put(self, data: bytes) -> bool:
+        """Queues data without blocking. Returns False if the client has been dropped."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.limit:
+            METRICS.count("outboxes_dropped")
+            self.close()
+            return False
+
+        self.queue.append(data)
+        self._ready.set()
+        return True
+
+    async def _pump(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+
+                batch = list(self.queue)
+                self.queue.clear()
+                self.writer.writelines(batch)
+                await self.writer.drain()
+        except (ConnectionError, CancelledError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._task.cancel()
+        self.writer.close()
 
 
 class BroadcastManager:
-    def __init__(self, *sockets: socket):
-        self.sockets = sockets
+    outboxes: set[Outbox]
+
+    def __init__(self, *outboxes: Outbox):
+        self.outboxes = set(outboxes)
+
+    def subscribe(self, outbox: Outbox):
+        self.outboxes.add(outbox)
+
+    def unsubscribe(self, outbox: Outbox):
+        self.outboxes.discard(outbox)
     
     def broadcast_bytes(self, data: bytes):
-        for sock in self.sockets:
-            sock.sendall(data)
+        dropped = [outbox for outbox in self.outboxes if not outbox.put(data)]
+        for outbox in dropped:
+            self.outboxes.discard(outbox)
+
+    def broadcast(self, data: dict, private: Optional[dict[bytes, dict]] = None):
+        """Queues a message for every subscriber.
+
+        The public fields in data are encoded once per codec in use. Fields in private are
+        keyed by player uuid bytes and only sent to that player's client, spliced into the
+        encoded public fields."""
+        encoded = {} # codec: (fragment, message)
+        dropped = []
+        for outbox in self.outboxes:
+            codec = outbox.codec
+            public = encoded.get(codec)
+            if public is None:
+                fragment = codec.fragment(data)
+                public = encoded[codec] = (fragment, codec.frame(fragment))
+            extra = None if private is None else private.get(outbox.owner)
+            payload = public[1] if extra is None else codec.frame(codec.merged(public[0], extra))
+            if not outbox.put(payload):
+                dropped.append(outbox)
+        for outbox in dropped:
+            self.outboxes.discard(outbox)
 
-    def broadcast(self, data: object):
-        self.broadcast_bytes(bytes(json.dumps(data), 'utf-8'))
\ No newline at end of file
+    def broadcast_batch(self, events: list[tuple[dict, Optional[dict[bytes, dict]]]]):
+        """Queues one batch message of several broadcasts, each given as broadcast() takes
+        them, for every subscriber. Each event is encoded once per codec in use."""
+        owners = set().union(*(private for _, private in events if private is not None))
+        encoded = {} # codec: (event fragments, message)
+        dropped = []
+        for outbox in self.outboxes:
+            codec = outbox.codec
+            public = encoded.get(codec)
+            if public is None:
+                fragments = [codec.fragment(data) for data, _ in events]
+                public = encoded[codec] = (fragments, codec.frame(codec.batch(fragments)))
+            owner = outbox.owner
+            if owner in owners:
+                payload = codec.frame(codec.batch([
+                    fragment if private is None or owner not in private else codec.merged(fragment, private[owner])
+                    for fragment, (_, private) in zip(public[0], events)
+                ]))
+            else:
+                payload = public[1]
+            if not outbox.put(payload):
+                dropped.append(outbox)
+        for outbox in dropped:
+            self.outboxes.discard(outbox)
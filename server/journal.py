@@ -0,0 +1,126 @@
+"""Append-only journal of every room's seed and accepted commands, for crash recovery.
+
+Each record is one line of JSON. Records are buffered in memory and encoded, written and
+fsynced together (group commit) every `interval` seconds on a worker thread, so no move
+waits on a disk flush or on encoding. A crash loses at most the last interval of moves.
+
+Recovering replays each room's commands on a Game built from the same seed, which
+reproduces the room exactly since all of a game's randomness comes from its seed."""
+import json
+import mmap
+import os
+from asyncio import sleep, get_running_loop
+from uuid import UUID
+from .base import BroadcastManager, MessageEncoder, RequestType
+from game import Game, Player
+from bot import BotPlayer
+
+JOURNALED = frozenset((
+    RequestType.JOIN,
+    RequestType.LEAVE,
+    RequestType.START_GAME,
+    RequestType.CALL_UNO,
+    RequestType.PLAY,
+    RequestType.DRAW,
+    RequestType.SET_WILD_COLOUR,
+    RequestType.BATCH,
+    RequestType.ADD_BOT,
+))
+
+# request fields that do not affect the game and are left out of the journal
+TRANSIENT = frozenset(("message_uuid", "room"))
+
+
+class Journal:
+    path: str
+    interval: float
+    pending: list[dict]
+
+    def __init__(self, path: str, interval: float = 0.05):
+        self.path = path
+        self.interval = interval
+        self.pending = []
+        self.file = open(path, "ab")
+
+    def append(self, record: dict):
+        self.pending.append(record)
+
+    def create(self, room_id: str, game: Game):
+        self.append({"room": room_id, "seed": game.seed, "decks": game.deck.decks})
+
+    def command(self, room_id: str, data: dict, response: dict):
+        """Records a request if it was accepted and changes the game."""
+        if response.get("status") != "done" or data.get("type") not in JOURNALED:
+            return
+        command = {key: value for key, value in data.items() if key not in TRANSIENT}
+        if command["type"] in (RequestType.JOIN, RequestType.ADD_BOT):
+            command["uuid"] = response["uuid"]
+        self.append({"room": room_id, "command": command})
+
+    def retire(self, room_id: str):
+        self.append({"room": room_id, "retire": True})
+
+    def _write(self, records: list[dict]):
+        encoder = MessageEncoder(separators=(",", ":"))
+        self.file.write("".join(encoder.encode(record) + "\n" for record in records).encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def take(self) -> list[dict]:
+        records = self.pending
+        self.pending = []
+        return records
+
+    def flush(self):
+        """Writes and fsyncs everything pending, blocking until it is on disk."""
+        if self.pending:
+            self._write(self.take())
+
+    async def run(self):
+        """Group commits pending records every interval, writing off the event loop."""
+        loop = get_running_loop()
+        while True:
+            await sleep(self.interval)
+            if self.pending:
+                await loop.run_in_executor(None, self._write, self.take())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def replay(game: Game, command: dict):
+    """Re-applies a journaled command. Joins reuse the uuid the player was originally given.
+    Bots' moves were journaled as the requests they made, so no bot thinks during recovery."""
+    if command["type"] in (RequestType.JOIN, RequestType.ADD_BOT):
+        kind = BotPlayer if command["type"] == RequestType.ADD_BOT else Player
+        game.add_player(kind(command["name"], game.deck, UUID(command["uuid"])))
+        return
+    game.process(command)
+
+
+def recover(path: str) -> dict[str, Game]:
+    """Rebuilds every room that was not retired from a journal, read through a memory map."""
+    games: dict[str, Game] = {}
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return games
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        for line in iter(view.readline, b""):
+            if not line.endswith(b"\n"):
+                break # torn final write
+            record = json.loads(line)
+            room_id = record["room"]
+
+            if "command" in record:
+                game = games.get(room_id)
+                if game is not None:
+                    replay(game, record["command"])
+            elif "seed" in record:
+                game = Game(record["decks"], record["seed"])
+                game.broadcast_manager = BroadcastManager()
+                games[room_id] = game
+            elif "retire" in record:
+                games.pop(room_id, None)
+
+    return games
@@ -0,0 +1,87 @@
+"""Structured, non-blocking logging for the server.
+
+Records are put on a queue by the event loop and formatted and written as JSON lines by
+a background thread, so logging never waits on stderr. Per-message records are logged at
+DEBUG and sampled: only one in every `sample` of them is kept."""
+import copy
+import json
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional, TextIO
+
+logger = logging.getLogger("uno")
+
+SAMPLE = 100
+
+
+class Sampler(logging.Filter):
+    """Keeps every record above DEBUG and one in every `sample` DEBUG records."""
+    sample: int
+
+    def __init__(self, sample: int):
+        super().__init__()
+        self.sample = sample
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        self._seen += 1
+        return self._seen % self.sample == 0
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Renders the message and traceback now, leaving the JSON for the writer thread."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: int | str = logging.INFO, sample: int = SAMPLE, stream: TextIO = sys.stderr) -> QueueListener:
+    """Routes the server's log records through a queue to a writer thread.
+
+    Calling it again (as a worker process does) replaces the previous configuration."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    queue = SimpleQueue()
+    handler = _QueueHandler(queue)
+    handler.addFilter(Sampler(sample))
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    _listener = QueueListener(queue, output)
+    _listener.start()
+    return _listener
+
+def fields(**values) -> dict:
+    """Structured fields for a record, passed as `extra`."""
+    return {"fields": values}
@@ -0,0 +1,126 @@
+"""Counters, gauges and latency histograms for one server process, rendered in the
+Prometheus text format.
+
+Recording is a dict lookup and an integer increment, so it is cheap enough to do on every
+request. Gauges are callables read only when the metrics are rendered. Everything is
+recorded on the event loop, except counters, which bots also count from their threads."""
+import threading
+from asyncio import StreamReader, StreamWriter, start_server
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (
+    .00001, .000025, .00005, .0001, .00025, .0005,
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0,
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    counts: list[int]
+    total: float
+    count: int
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self.total}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Metrics:
+    """The metrics of one process. Requests are labelled by their type."""
+    latency: defaultdict[str, Histogram]
+    histograms: defaultdict[str, Histogram]
+    requests: defaultdict[str, int]
+    errors: defaultdict[str, int]
+    counters: defaultdict[str, int]
+    gauges: dict[str, Callable[[], float]]
+
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.histograms = defaultdict(Histogram)
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self._counting = threading.Lock()
+
+    def request(self, request_type: str, seconds: float, failed: bool):
+        self.latency[request_type].observe(seconds)
+        self.requests[request_type] += 1
+        if failed:
+            self.errors[request_type] += 1
+
+    def observe(self, name: str, seconds: float):
+        self.histograms[name].observe(seconds)
+
+    def count(self, name: str, n: int = 1):
+        with self._counting:
+            self.counters[name] += n
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        self.gauges[name] = read
+
+    def render(self) -> str:
+        lines = []
+        for name, values in (("uno_requests_total", self.requests), ("uno_request_errors_total", self.errors)):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f'{name}{{type="{request_type}"}} {n}' for request_type, n in sorted(values.items()))
+
+        lines.append("# TYPE uno_request_seconds histogram")
+        for request_type, histogram in sorted(self.latency.items()):
+            lines.extend(histogram.render("uno_request_seconds", f'type="{request_type}",'))
+
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f"# TYPE uno_{name} histogram")
+            lines.extend(histogram.render(f"uno_{name}", ""))
+
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"# TYPE uno_{name}_total counter")
+            lines.append(f"uno_{name}_total {n}")
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"# TYPE uno_{name} gauge")
+            lines.append(f"uno_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+async def _respond(reader: StreamReader, writer: StreamWriter):
+    try:
+        while (await reader.readline()).strip():
+            pass # only GET is served, so the request line and headers are not needed
+        body = METRICS.render().encode()
+        writer.write(
+            b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve_metrics(host: str, port: int):
+    """Serves the metrics of this process over HTTP, for scrapers or curl."""
+    return await start_server(_respond, host, port)
@@ -0,0 +1,185 @@
+"""On-demand profiling of one room or the whole process, started by an admin request.
+
+Two modes are available:
+
+- sampling: a SIGPROF timer interrupts the process every millisecond of CPU time and
+  records the Python stack it interrupted. Cheap enough to leave running on a busy server.
+- deterministic: sys.setprofile records the time spent in every call. Exact, but it slows
+  the profiled code down several times.
+
+A room profile only records while that room's requests are dispatched (Game.process and
+the broadcasts it queues); a process profile records everything. Results are written in
+the collapsed-stack format read by flamegraph.pl and speedscope. While no profile runs,
+the only cost is a None check per dispatched request."""
+import hmac
+import os
+import re
+import signal
+import sys
+import time
+from asyncio import get_running_loop
+from collections import Counter
+from typing import Optional
+from dispatch import error
+from .logs import logger, fields
+
+TOKEN_ENV = "UNO_ADMIN_TOKEN" # profiling is refused unless this is set and matched
+DIRECTORY_ENV = "UNO_PROFILE_DIR"
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 300
+SAMPLE_INTERVAL = 0.001
+
+UNAUTHORISED = error("admin token missing or invalid.")
+BUSY = error("a profile is already running.")
+MODE_INVALID = error("mode must be sampling or deterministic.")
+SECONDS_INVALID = error(f"seconds must be an integer from 1 to {MAX_SECONDS}.")
+ROOM_MISSING = error("room does not exist.")
+
+
+def _name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+class Profiler:
+    """Collects collapsed stacks. Used as a context manager around a room's dispatches, or
+    started for the whole process."""
+    stacks: Counter
+    label: str
+    active: bool
+
+    def __init__(self, label: str):
+        self.stacks = Counter()
+        self.label = label
+        self.active = False
+
+    def __enter__(self):
+        self.active = True
+
+    def __exit__(self, *_):
+        self.active = False
+
+    def start(self, process: bool):
+        """Starts collecting; if process is set, everything is recorded rather than only what
+        happens inside the context manager."""
+        self.active = process
+
+    def stop(self):
+        self.active = False
+
+    def write(self, path: str):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class SamplingProfiler(Profiler):
+    """Counts the stacks interrupted by a CPU-time timer."""
+
+    def _sample(self, signum, frame):
+        if not self.active or frame is None:
+            return
+        names = []
+        while frame is not None:
+            names.append(_name(frame.f_code))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(names))] += 1
+
+    def start(self, process: bool):
+        super().start(process)
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        super().stop()
+
+
+class TracingProfiler(Profiler):
+    """Records microseconds spent in every stack, from profiler call and return events."""
+
+    def __init__(self, label: str):
+        super().__init__(label)
+        self._stack = []
+        self._last = 0
+
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if self._stack:
+            self.stacks[";".join(self._stack)] += (now - self._last) // 1000
+        if event == "call":
+            self._stack.append(_name(frame.f_code))
+        elif event == "c_call":
+            self._stack.append(getattr(arg, "__qualname__", repr(arg)))
+        elif self._stack:
+            self._stack.pop()
+        self._last = time.perf_counter_ns()
+
+    def __enter__(self):
+        self._stack = []
+        self._last = time.perf_counter_ns()
+        sys.setprofile(self._trace)
+
+    def __exit__(self, *_):
+        sys.setprofile(None)
+
+    def start(self, process: bool):
+        if process:
+            self.__enter__()
+
+    def stop(self):
+        sys.setprofile(None)
+
+
+PROFILERS = {"sampling": SamplingProfiler, "deterministic": TracingProfiler}
+
+running: Optional[Profiler] = None
+
+
+def authorised(token) -> bool:
+    expected = os.environ.get(TOKEN_ENV)
+    return bool(expected) and isinstance(token, str) and hmac.compare_digest(token.encode(), expected.encode())
+
+def profile(rooms, info: dict) -> dict:
+    """Handles a profile request: starts a profile of info["room"] (or the process, without
+    one) for info["seconds"], writing it to a file when the time is up."""
+    global running
+    if not authorised(info.get("token")):
+        return UNAUTHORISED
+    if running is not None:
+        return BUSY
+
+    kind = PROFILERS.get(info.get("mode", "sampling"))
+    if kind is None:
+        return MODE_INVALID
+    seconds = info.get("seconds", DEFAULT_SECONDS)
+    if type(seconds) is not int or not 1 <= seconds <= MAX_SECONDS:
+        return SECONDS_INVALID
+
+    room = None
+    if "room" in info:
+        room = rooms.get(info["room"]) if isinstance(info["room"], str) else None
+        if room is None:
+            return ROOM_MISSING
+
+    label = "process" if room is None else "room-" + re.sub(r"[^\w-]", "_", room.room_id)
+    path = os.path.join(os.environ.get(DIRECTORY_ENV, "."), f"profile-{label}-{os.getpid()}-{int(time.time())}.folded")
+    profiler = running = kind(label)
+    profiler.start(room is None)
+    if room is not None:
+        room.profiler = profiler
+
+    def finish():
+        global running
+        profiler.stop()
+        if room is not None:
+            room.profiler = None
+        running = None
+        try:
+            profiler.write(path)
+            logger.info("profile written", extra=fields(path=path, stacks=len(profiler.stacks)))
+        except OSError:
+            logger.exception("profile not written", extra=fields(path=path))
+
+    get_running_loop().call_later(seconds, finish)
+    return {"status": "done", "path": path, "seconds": seconds}
@@ -0,0 +1,308 @@
+"""Wire formats spoken by the server.
+
+JSON mode (the default and fallback): one JSON object per line, in both directions.
+
+Framed binary mode: a client opts in by sending MAGIC before its first message, and the
+server acknowledges by echoing it. From then on every message in both directions is a
+4-byte big-endian length followed by a compactly encoded value. Well known strings
+(request types, keys, statuses, colours and values) are sent as one-byte symbols, cards
+as one-byte card codes (Card.code) and UUIDs as their 16 raw bytes."""
+import json
+from struct import Struct
+from uuid import UUID
+from asyncio import StreamReader
+from deck import Card, Colour, ColourValue, WildValue, CODE_COUNT
+from .base import RequestType, MessageEncoder
+
+MAGIC = b"UNO\x02" # the last byte is the protocol version
+MAX_FRAME = 1 << 20
+MAX_DEPTH = 32 # nesting of lists and dicts a frame may use; no request needs more than a few
+
+_length = Struct("!I")
+_double = Struct("!d")
+
+NONE, FALSE, TRUE, INT, FLOAT, STR, LIST, DICT, UUID_, CARD, SYMBOL = range(11)
+
+# A symbol's code is its position here, so the table is append-only: new symbols go at the
+# end, and removing or reordering any means a new protocol version in MAGIC.
+SYMBOLS: tuple[str, ...] = (
+    # request types
+    "join", "leave", "start_game", "call_uno", "play", "draw", "set_wild_colour",
+    "query_top_card", "query_hand", "query_card_counts", "query_names", "snapshot",
+    "metrics", "profile", "batch", "add_bot",
+    # keys
+    "type", "status", "message", "uuid", "room", "name", "index", "wild_colour",
+    "colour", "value", "card", "cards", "hand", "players", "current_player", "top_card",
+    "card_counts", "winner", "message_uuid", "responding_to", "legal_moves",
+    "seq", "count", "direction", "state", "ongoing", "operations", "results", "events",
+    # message types and statuses
+    "response", "game_start", "game_end", "turn", "card_added", "card_removed", "player_left",
+    "done", "error", "no action",
+    # colours and values
+    "red", "green", "blue", "yellow", "wild",
+    "0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "Draw 2", "Skip", "Reverse",
+    "Wild", "Draw 4",
+)
+SYMBOL_CODES: dict[str, int] = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+assert len(SYMBOLS) <= 256 and len(SYMBOL_CODES) == len(SYMBOLS)
+assert SYMBOL_CODES.keys() >= {str.__str__(symbol) for symbol in (*RequestType, *Colour, *ColourValue, *WildValue)}, \
+    "every request type, colour and value needs a symbol, added at the end of SYMBOLS"
+
+CARD_FACES: tuple[tuple[str, str, str | None], ...] = tuple(
+    (card.colour.value, card.value.value, card.wild_colour and card.wild_colour.value)
+    for card in map(Card.from_code, range(CODE_COUNT))
+)
+CARD_CODES: dict[tuple, int] = {face: code for code, face in enumerate(CARD_FACES)}
+
+
+def card_code(data: dict) -> int | None:
+    """Returns the card code for a dict shaped exactly like Card.as_data(), otherwise None."""
+    size = len(data)
+    if size == 2:
+        return CARD_CODES.get((data.get("colour"), data.get("value"), None))
+    if size == 3 and data.get("wild_colour") is not None:
+        return CARD_CODES.get((data.get("colour"), data.get("value"), data["wild_colour"]))
+    return None
+
+
+def _varint(out: bytearray, n: int):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _encode(out: bytearray, obj):
+    if obj is None:
+        out.append(NONE)
+    elif obj is True:
+        out.append(TRUE)
+    elif obj is False:
+        out.append(FALSE)
+    elif isinstance(obj, str):
+        code = SYMBOL_CODES.get(obj)
+        if code is not None:
+            out.append(SYMBOL)
+            out.append(code)
+        else:
+            raw = obj.encode()
+            out.append(STR)
+            _varint(out, len(raw))
+            out += raw
+    elif isinstance(obj, int):
+        out.append(INT)
+        _varint(out, -2 * obj - 1 if obj < 0 else obj << 1)
+    elif isinstance(obj, dict):
+        code = card_code(obj)
+        if code is not None:
+            out.append(CARD)
+            out.append(code)
+            return
+        out.append(DICT)
+        _varint(out, len(obj))
+        for key, value in obj.items():
+            _encode(out, key)
+            _encode(out, value)
+    elif isinstance(obj, (list, tuple)):
+        out.append(LIST)
+        _varint(out, len(obj))
+        for value in obj:
+            _encode(out, value)
+    elif isinstance(obj, UUID):
+        out.append(UUID_)
+        out += obj.bytes
+    elif isinstance(obj, Card):
+        out.append(CARD)
+        out.append(obj.code)
+    elif isinstance(obj, float):
+        out.append(FLOAT)
+        out += _double.pack(obj)
+    else:
+        raise TypeError(f"Cannot encode {type(obj).__name__}")
+
+def encode(obj) -> bytes:
+    """Encodes a value into a binary frame, including its length prefix."""
+    out = bytearray(4)
+    _encode(out, obj)
+    _length.pack_into(out, 0, len(out) - 4)
+    return bytes(out)
+
+def _read_varint(data: bytes, i: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+def _card(code: int) -> dict:
+    colour, value, wild_colour = CARD_FACES[code]
+    if wild_colour is None:
+        return {"value": value, "colour": colour}
+    return {"value": value, "colour": colour, "wild_colour": wild_colour}
+
+def _decode(view: memoryview, i: int, depth: int = 0):
+    tag = view[i]
+    i += 1
+    if tag == SYMBOL:
+        return SYMBOLS[view[i]], i + 1
+    if tag == DICT or tag == LIST or tag == STR or tag == INT:
+        n = shift = 0
+        while True:
+            byte = view[i]
+            i += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        if tag == INT:
+            return (n >> 1) ^ -(n & 1), i
+        if tag == STR:
+            return str(view[i:i + n], "utf-8"), i + n
+        if depth == MAX_DEPTH:
+            raise ValueError("Frame nested too deeply")
+        if tag == LIST:
+            items = []
+            for _ in range(n):
+                item, i = _decode(view, i, depth + 1)
+                items.append(item)
+            return items, i
+        items = {}
+        for _ in range(n):
+            key, i = _decode(view, i, depth + 1)
+            if type(key) is list or type(key) is dict:
+                raise ValueError("Unhashable dict key")
+            items[key], i = _decode(view, i, depth + 1)
+        return items, i
+    if tag == CARD:
+        return _card(view[i]), i + 1
+    if tag == UUID_:
+        return UUID(bytes=bytes(view[i:i + 16])), i + 16
+    if tag == NONE:
+        return None, i
+    if tag == TRUE:
+        return True, i
+    if tag == FALSE:
+        return False, i
+    if tag == FLOAT:
+        return _double.unpack_from(view, i)[0], i + 8
+    raise ValueError(f"Unknown tag {tag}")
+
+def decode(body: bytes | memoryview):
+    """Decodes one frame body (without its length prefix), reading in place from the buffer."""
+    view = memoryview(body)
+    try:
+        obj, end = _decode(view, 0)
+    except IndexError:
+        raise ValueError("Truncated frame")
+    if end != len(view):
+        raise ValueError("Trailing bytes in frame")
+    return obj
+
+
+class JsonCodec:
+    """Besides whole messages, encodes fragments: values without the message framing, which
+    broadcasts splice together so that each message's public fields are encoded once."""
+    name = "json"
+
+    async def read(self, reader: StreamReader) -> bytes:
+        return await reader.readuntil(b"\n")
+
+    def decode(self, data: bytes):
+        try:
+            return json.loads(data)
+        except RecursionError:
+            raise ValueError("Message nested too deeply")
+
+    def encode(self, obj) -> bytes:
+        return bytes(json.dumps(obj, cls=MessageEncoder), 'utf-8') + b"\n"
+
+    def fragment(self, obj) -> bytes:
+        return bytes(json.dumps(obj, cls=MessageEncoder), 'utf-8')
+
+    def frame(self, fragment: bytes) -> bytes:
+        return fragment + b"\n"
+
+    def merged(self, fragment: bytes, extra: dict) -> bytes:
+        """The fragment of a dict with the fields of extra added."""
+        if not extra:
+            return fragment
+        return fragment[:-1] + (b", " if len(fragment) > 2 else b"") + self.fragment(extra)[1:]
+
+    def batch(self, fragments: list[bytes]) -> bytes:
+        """The fragment of a batch message of the encoded events."""
+        return b'{"type": "batch", "events": [' + b", ".join(fragments) + b"]}"
+
+
+class BinaryCodec:
+    name = "binary"
+
+    async def read(self, reader: StreamReader) -> bytes:
+        n = _length.unpack(await reader.readexactly(4))[0]
+        if n > MAX_FRAME:
+            raise ValueError(f"Frame of {n} bytes exceeds limit")
+        return await reader.readexactly(n)
+
+    def decode(self, data: bytes):
+        return decode(data)
+
+    def encode(self, obj) -> bytes:
+        return encode(obj)
+
+    def fragment(self, obj) -> bytes:
+        out = bytearray()
+        _encode(out, obj)
+        return bytes(out)
+
+    def frame(self, fragment: bytes) -> bytes:
+        return _length.pack(len(fragment)) + fragment
+
+    def merged(self, fragment: bytes, extra: dict) -> bytes:
+        """The fragment of a dict with the fields of extra added. A duplicated key decodes to
+        its last value, as in JSON."""
+        if not extra:
+            return fragment
+        count, start = _read_varint(fragment, 1)
+        out = bytearray((DICT,))
+        _varint(out, count + len(extra))
+        out += memoryview(fragment)[start:]
+        for key, value in extra.items():
+            _encode(out, key)
+            _encode(out, value)
+        return bytes(out)
+
+    def batch(self, fragments: list[bytes]) -> bytes:
+        """The fragment of a batch message of the encoded events."""
+        out = bytearray(_BATCH)
+        _varint(out, len(fragments))
+        for fragment in fragments:
+            out += fragment
+        return bytes(out)
+
+
+# a batch message up to the length of its events list
+_BATCH = bytearray((DICT, 2))
+_encode(_BATCH, "type")
+_encode(_BATCH, "batch")
+_encode(_BATCH, "events")
+_BATCH.append(LIST)
+_BATCH = bytes(_BATCH)
+
+JSON = JsonCodec()
+BINARY = BinaryCodec()
+
+
+async def negotiate(reader: StreamReader) -> tuple[JsonCodec | BinaryCodec, bytes]:
+    """Reads the start of a connection to decide its codec.
+
+    Returns the codec and any bytes consumed that belong to the first message."""
+    first = await reader.readexactly(1)
+    if first != MAGIC[:1]:
+        return JSON, first
+
+    rest = await reader.readexactly(len(MAGIC) - 1)
+    if first + rest != MAGIC:
+        return JSON, first + rest
+    return BINARY, b""
@@ -0,0 +1,224 @@
+from .base import BroadcastManager
+from .journal import Journal, recover
+from .logs import logger, fields
+from .metrics import METRICS
+from game import Game
+from bot import BotPlayer, fallback
+from dispatch import error
+from asyncio import Task, create_task, get_running_loop, sleep
+from collections import deque
+from contextlib import nullcontext, AbstractContextManager
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Optional
+
+DEFAULT_ROOM = "default"
+MAX_BOT_MOVES = 1000 # bot moves made after one request, so a table of bots cannot hold the loop forever
+BATCH_LIMIT = 64 # commands a room runs before giving the other rooms a turn
+INTERNAL_ERROR = error("internal error.")
+
+# bots think on these threads; the room waits for its bot without holding up the event loop
+THINKING = ThreadPoolExecutor(4, thread_name_prefix="bot")
+_UNPROFILED = nullcontext()
+
+
+class Room:
+    """A single table: one Game plus the connections bound to it."""
+    room_id: str
+    game: Game
+    connections: set
+    profiler: Optional[object] # a server.profiling.Profiler while the room is being profiled
+    # commands waiting for the room: the request, the callbacks its response goes to (see
+    # RoomRegistry.submit) and when it was queued
+    queue: deque[tuple[dict, Callable[[dict], None], Callable[[dict], None], float]]
+    task: Optional[Task] # drains the queue while it has commands in it
+
+    def __init__(self, room_id: str, game: Optional[Game] = None):
+        self.room_id = room_id
+        self.game = Game() if game is None else game
+        self.game.broadcast_manager = BroadcastManager()
+        self.connections = set()
+        self.profiler = None
+        self.queue = deque()
+        self.task = None
+
+    def profiled(self) -> AbstractContextManager:
+        """The room's profiler as a context manager, or one that does nothing if it has none."""
+        return _UNPROFILED if self.profiler is None else self.profiler
+
+
+class RoomRegistry:
+    """Creates, finds and retires rooms. Every lookup is a single dict access."""
+    rooms: dict[str, Room]
+    journal: Optional[Journal]
+
+    def __init__(self, journal: Optional[Journal] = None):
+        self.rooms = {}
+        self.journal = journal
+
+    def recover(self, path: str) -> int:
+        """Restores every room recorded in a journal. Returns the number of rooms restored."""
+        games = recover(path)
+        for room_id, game in games.items():
+            self.rooms[room_id] = Room(room_id, game)
+        return len(games)
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def get(self, room_id: str) -> Optional[Room]:
+        return self.rooms.get(room_id)
+
+    def create(self, room_id: str) -> Room:
+        if room_id in self.rooms:
+            raise KeyError(f"Room {room_id} already exists")
+
+        room = Room(room_id)
+        self.rooms[room_id] = room
+        # the seed reproduces the room's every shuffle, with or without a journal
+        logger.info("room created", extra=fields(room=room_id, seed=room.game.seed))
+        if self.journal is not None:
+            self.journal.create(room_id, room.game)
+        return room
+
+    def get_or_create(self, room_id: str) -> Room:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.create(room_id)
+        return room
+
+    def retire(self, room: Room) -> None:
+        """Drops a room from the registry so that it (and its Game) can be garbage collected."""
+        if self.rooms.get(room.room_id) is room:
+            del self.rooms[room.room_id]
+            if self.journal is not None:
+                self.journal.retire(room.room_id)
+
+    def bind(self, room_id: str, connection) -> Room:
+        room = self.get_or_create(room_id)
+        room.connections.add(connection)
+        return room
+
+    def unbind(self, room: Room, connection) -> None:
+        """Removes a connection from its room, retiring the room once nobody is left in it."""
+        room.connections.discard(connection)
+        if not room.connections:
+            self.retire(room)
+
+    def apply(self, room: Room, data: dict) -> dict:
+        response = room.game.process(data)
+        if self.journal is not None:
+            self.journal.command(room.room_id, data, response)
+        return response
+
+    def play_bots(self, room: Room):
+        """Makes the moves of every bot whose turn comes up, until it is a person's turn."""
+        game = room.game
+        for _ in range(MAX_BOT_MOVES):
+            bot = game.current_player()
+            if not game.ongoing or not isinstance(bot, BotPlayer):
+                return
+            try:
+                request = bot.choose(game)
+            except Exception:
+                logger.exception("bot failed to choose", extra=fields(room=room.room_id))
+                request = fallback(game, bot)
+            with room.profiled():
+                self.apply(room, request)
+
+    def execute(self, room: Room, commands: list[dict], applied: Optional[list[Callable[[dict], None]]] = None) -> list[dict]:
+        """Applies commands in order, sending all of their broadcasts as one message at the end.
+        applied[i], if given, gets command i's response as soon as it is applied, before the
+        broadcasts go out."""
+        game = room.game
+        responses = []
+        with room.profiled():
+            game.batched = []
+            try:
+                for i, data in enumerate(commands):
+                    try:
+                        response = self.apply(room, data)
+                    except Exception:
+                        logger.exception("request failed", extra=fields(room=room.room_id, request=data))
+                        response = INTERNAL_ERROR
+                    responses.append(response)
+                    if applied is not None:
+                        applied[i](response)
+            finally:
+                events, game.batched = game.batched, None
+                if events:
+                    game.broadcast_batch(events)
+        return responses
+
+    def submit(self, room: Room, data: dict, reply: Callable[[dict], None], applied: Callable[[dict], None]):
+        """Queues a command for the room, whose task will pass its response to applied as
+        soon as the command is applied (so a join can claim its player's private broadcast
+        fields before they are sent) and to reply once its broadcasts have gone out.
+
+        Each room is a single writer: only its task changes its game, one batch of commands
+        at a time, so commands to a room apply in the order they were submitted."""
+        room.queue.append((data, reply, applied, perf_counter()))
+        if room.task is None:
+            room.task = create_task(self.run(room))
+
+    async def run(self, room: Room):
+        """Drains the room's queue a batch at a time, yielding to other rooms after each batch
+        and each bot move."""
+        try:
+            while room.queue:
+                batch = [room.queue.popleft() for _ in range(min(len(room.queue), BATCH_LIMIT))]
+                now = perf_counter()
+                for *_, queued in batch:
+                    METRICS.observe("room_queue_seconds", now - queued)
+                METRICS.count("room_batches")
+                METRICS.count("room_commands", len(batch))
+
+                responses = self.execute(room, [data for data, *_ in batch], [applied for _, _, applied, _ in batch])
+                # responses follow the broadcasts, as they would if each command ran alone
+                for (_, reply, _, _), response in zip(batch, responses):
+                    reply(response)
+
+                await self.think(room)
+                if room.game.finished:
+                    self.retire(room)
+                await sleep(0)
+        finally:
+            room.task = None
+
+    async def think(self, room: Room):
+        """Makes the moves of every bot whose turn comes up, thinking off the event loop.
+        Nothing else changes the game meanwhile, since this is the room's own task."""
+        game = room.game
+        loop = get_running_loop()
+        for _ in range(MAX_BOT_MOVES):
+            bot = game.current_player()
+            if not game.ongoing or not isinstance(bot, BotPlayer):
+                return
+            start = perf_counter()
+            try:
+                request = await loop.run_in_executor(THINKING, bot.choose, game)
+            except Exception:
+                # the room goes on with a simpler move rather than stopping with its task
+                logger.exception("bot failed to choose", extra=fields(room=room.room_id))
+                request = fallback(game, bot)
+            METRICS.observe("bot_thinking_seconds", perf_counter() - start)
+            self.execute(room, [request])
+
+    def queued(self) -> tuple[int, float]:
+        """The longest room queue, and how long its oldest command has been waiting, across rooms."""
+        now = perf_counter()
+        queues = [room.queue for room in self.rooms.values() if room.queue]
+        return max(map(len, queues), default=0), max((now - queue[0][3] for queue in queues), default=0.0)
+
+    def dispatch(self, room: Room, data: dict) -> dict:
+        """Applies a command immediately, playing any bots' turns that follow inline; for
+        callers that drive rooms without an event loop."""
+        with room.profiled():
+            response = self.apply(room, data)
+        if response.get("status") == "done" and room.game.ongoing:
+            self.play_bots(room)
+
+        if room.game.finished:
+            self.retire(room)
+
+        return response
@@ -1,82 +1,215 @@
-import socket
-import json
-from .base import BroadcastManager
-from game import Game
-from uuid import UUID
+from .base import Outbox, RequestType
+from .protocol import JSON, MAGIC, negotiate
+from .rooms import RoomRegistry, Room, DEFAULT_ROOM, INTERNAL_ERROR, BATCH_LIMIT
+from .metrics import METRICS, serve_metrics
+from .profiling import profile
+from .logs import logger, fields
+from deck import SHUFFLES, ShufflePool
+from bot import BUDGET, start_bots, stop_bots
+from typing import Optional
 from functools import partial
+from time import perf_counter
+from logging import DEBUG
 
-from asyncio import start_server, StreamReader, StreamWriter
+from asyncio import start_server, create_task, sleep, StreamReader, StreamWriter, IncompleteReadError, LimitOverrunError
 
 
-class UUIDEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, UUID):
-            return obj.hex
-        return json.JSONEncoder.default(self, obj)
-
 HOST = "127.0.0.1"  # The server's hostname or IP address
 PORT = 60001  # The port used by the server
 
+REQUEST_TYPES = frozenset(RequestType)
 
-def process(data: bytes, game: Game) -> bytes:
-    try:
-        info = json.loads(data)
-    except json.decoder.JSONDecodeError as w:
-        print(w)
-        return # silently fail?
 
-    try:
-        response = game.process(info)
-    except Exception as f:
-        print(f)
+class Connection:
+    """A client connection, bound to at most one room for its whole lifetime."""
+    room: Optional[Room]
+    outbox: Optional[Outbox]
+    codec: object
+
+    def __init__(self, outbox: Optional[Outbox] = None, codec = JSON):
+        self.room = None
+        self.outbox = outbox
+        self.codec = codec if outbox is None else outbox.codec
+
+
+def bind(rooms: RoomRegistry, connection: Connection, info: dict) -> Optional[dict]:
+    """Binds the connection to the room named in the request. Returns an error response if that is not possible."""
+    room_id = info.get("room", DEFAULT_ROOM)
 
+    if connection.room is None:
+        if not isinstance(room_id, str):
+            return {"status": "error", "message": "room must be a string."}
+        connection.room = rooms.bind(room_id, connection)
+        if connection.outbox is not None:
+            connection.room.game.broadcast_manager.subscribe(connection.outbox)
+        return None
 
-    if response is None: 
-        print("response: none")
+    if "room" in info and room_id != connection.room.room_id:
+        return {"status": "error", "message": "connection is bound to another room."}
+
+    if rooms.get(connection.room.room_id) is not connection.room:
+        return {"status": "error", "message": "room has closed."}
+
+    return None
+
+
+def unbind(rooms: RoomRegistry, connection: Connection):
+    if connection.room is None:
         return
-    response["type"] = "response"
-    if "message_uuid" in response:
-        response["responding_to"] = info["message_uuid"]
+    if connection.outbox is not None:
+        connection.room.game.broadcast_manager.unsubscribe(connection.outbox)
+    rooms.unbind(connection.room, connection)
+    connection.room = None
 
-    print(f"response: {response}")
-
-    return bytes(json.dumps(response, cls=UUIDEncoder), 'utf-8') + b'\x00'
-
-def host_game(game: Game):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen()
-        conn, addr = s.accept()
-        with conn:
-            print(f"Connected by {addr}")
-            while True:
-                data = conn.recv(1024)
-                if not data:
-                    break
-                r = process(data, game)
-                if r is not None:
-                    conn.sendto(r, addr)
-
-    
-async def handle_connection(game: Game, reader: StreamReader, writer: StreamWriter):
-    print(f"Connection on {writer.transport.get_extra_info('peername')}")
-    while True:
-        data = await reader.readuntil()
-        print(data)
-        r = process(data, game)
-        if r is not None:
-            writer.write(r)
 
-async def async_host_game(game: Game):
+def receive(data: bytes, rooms: RoomRegistry, connection: Connection) -> tuple[Optional[dict], Optional[dict]]:
+    """Decodes a request and answers those its room is not needed for: metrics, profiles and
+    binding errors. Returns the request (None if there is none to answer) and its response,
+    which is None when the request is for the connection's room."""
+    try:
+        info = connection.codec.decode(data)
+    except ValueError as w:
+        METRICS.count("undecodable_requests")
+        logger.warning("undecodable request", extra=fields(error=str(w)))
+        return None, None
+
+    if not isinstance(info, dict):
+        return None, None
+
+    request_type = info.get("type")
+    if request_type == RequestType.METRICS:
+        return info, {"status": "done", "metrics": METRICS.render()}
+    if request_type == RequestType.PROFILE:
+        return info, profile(rooms, info)
+    return info, bind(rooms, connection, info)
+
+def claim(connection: Connection, info: dict, response: dict):
+    """Binds the connection to the player it joined as, once the join has been applied and
+    before its broadcasts are sent.
+
+    Private broadcast fields are only sent to the client that joined as their player. Only
+    a join binds: uuids are public, as every player's appears in broadcasts, so naming one
+    proves nothing. A client that has lost its connection resynchronises from a snapshot."""
+    if info.get("type") != RequestType.JOIN or response.get("status") != "done":
+        return
+    if connection.outbox is not None and connection.outbox.owner is None:
+        connection.outbox.owner = response["uuid"].bytes
+
+def respond(connection: Connection, info: dict, start: float, response: dict) -> bytes:
+    """Records and encodes the response to a request received at start."""
+    request_type = info.get("type")
+    response = {**response, "type": "response"}
+    if "message_uuid" in info:
+        response["responding_to"] = info["message_uuid"]
+
+    METRICS.request(request_type if type(request_type) is str and request_type in REQUEST_TYPES else "invalid", perf_counter() - start, response["status"] == "error")
+    if logger.isEnabledFor(DEBUG):
+        logger.debug("request", extra=fields(request=info, response=response))
+
+    return connection.codec.encode(response)
+
+def process(data: bytes, rooms: RoomRegistry, connection: Connection) -> Optional[bytes]:
+    """Handles a request to completion without the room's queue, for tools that drive rooms
+    without an event loop. Served connections submit to the room's queue instead."""
+    start = perf_counter()
+    info, response = receive(data, rooms, connection)
+    if info is None:
+        return None
+    if response is None:
+        try:
+            response = rooms.dispatch(connection.room, info)
+        except Exception:
+            logger.exception("request failed", extra=fields(request=info))
+            response = INTERNAL_ERROR
+        claim(connection, info, response)
+    return respond(connection, info, start, response)
+
+def reply(connection: Connection, info: dict, start: float, response: dict):
+    connection.outbox.put(respond(connection, info, start, response))
+
+async def handle_connection(rooms: RoomRegistry, reader: StreamReader, writer: StreamWriter):
+    logger.debug("connection", extra=fields(peer=writer.transport.get_extra_info('peername')))
+    try:
+        codec, data = await negotiate(reader)
+    except (IncompleteReadError, ConnectionError):
+        writer.close()
+        return
+    if codec is not JSON:
+        writer.write(MAGIC)
 
+    connection = Connection(Outbox(writer, codec))
+    METRICS.count("connections_opened")
+    try:
+        while not connection.outbox.closed:
+            data += await codec.read(reader)
+            start = perf_counter()
+            info, response = receive(data, rooms, connection)
+            data = b""
+            if response is not None:
+                reply(connection, info, start, response)
+            elif info is not None:
+                rooms.submit(connection.room, info, partial(reply, connection, info, start), partial(claim, connection, info))
+            if len(connection.outbox.queue) > connection.outbox.limit // 2 or (connection.room is not None and len(connection.room.queue) > BATCH_LIMIT):
+                await sleep(0) # let the outbox and the room catch up before reading more requests
+    except (IncompleteReadError, LimitOverrunError, ConnectionError, ValueError):
+        pass
+    finally:
+        METRICS.count("connections_closed")
+        unbind(rooms, connection)
+        connection.outbox.close()
+
+SHUFFLE_CHUNK = 16 # decks shuffled between yields to the event loop, about a millisecond's work
+
+async def refill(pool: ShufflePool, interval: float = 0.1):
+    """Keeps the shuffle pool topped up, a chunk at a time so that requests are never held up for long."""
+    while True:
+        await sleep(0 if pool.fill(SHUFFLE_CHUNK) else interval)
+
+def watch(rooms: RoomRegistry):
+    """Registers the gauges describing the rooms of this process."""
+    def outboxes():
+        return [outbox for room in rooms.rooms.values() for outbox in room.game.broadcast_manager.outboxes]
+
+    METRICS.gauge("rooms", lambda: len(rooms))
+    METRICS.gauge("connections", lambda: METRICS.counters["connections_opened"] - METRICS.counters["connections_closed"])
+    METRICS.gauge("outbox_queued", lambda: sum(len(outbox.queue) for outbox in outboxes()))
+    METRICS.gauge("outbox_queued_max", lambda: max((len(outbox.queue) for outbox in outboxes()), default=0))
+    METRICS.gauge("room_queue_max", lambda: rooms.queued()[0])
+    METRICS.gauge("room_queue_oldest_seconds", lambda: rooms.queued()[1])
+    METRICS.gauge("shuffle_pool", lambda: len(SHUFFLES))
+    METRICS.gauge("shuffle_pool_misses", lambda: SHUFFLES.misses)
+
+async def async_host_game(
+    rooms: Optional[RoomRegistry] = None, host: str = HOST, port: int = PORT, metrics_port: Optional[int] = None,
+    shuffle_pool: int = 0, bot_budget: float = BUDGET,
+):
+    """Serves rooms until cancelled. With a metrics port, the metrics are also served over HTTP
+    on it; with a shuffle pool size, new rooms take decks that a background task shuffled."""
+    if rooms is None:
+        rooms = RoomRegistry()
+    start_bots(bot_budget)
+    watch(rooms)
+    SHUFFLES.size = shuffle_pool
+    refill_task = create_task(refill(SHUFFLES))
+
+    server = await start_server(partial(handle_connection, rooms), host, port)
+    if metrics_port is not None:
+        metrics_server = await serve_metrics(host, metrics_port)
+
+    if rooms.journal is not None:
+        journal_task = create_task(rooms.journal.run())
 
-    server = await start_server(partial(handle_connection, game), HOST, PORT)
-    
-    broadcast_manager = BroadcastManager(*server.sockets)
-    game.broadcast_manager = broadcast_manager
-    
     addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
-    print(f'Serving on {addrs}')
+    logger.info("serving", extra=fields(addresses=addrs, metrics_port=metrics_port))
 
-    async with server:
-        await server.serve_forever()
\ No newline at end of file
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refill_task.cancel()
+        if metrics_port is not None:
+            metrics_server.close()
+        if rooms.journal is not None:
+            journal_task.cancel()
+            rooms.journal.close()
+        stop_bots()
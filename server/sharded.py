@@ -0,0 +1,214 @@
+"""Runs the server across several worker processes, each owning a shard of the rooms.
+
+A front acceptor process accepts every connection and reads just enough of it to find
+the room named by its first message. It then passes the socket, together with the bytes
+it has already read, to the worker that owns that room over a Unix seqpacket socket.
+Rooms are assigned to workers by a stable hash of their id, so every connection to a
+room lands in the same worker and the room never moves.
+
+A worker stops when that socket closes, so workers never outlive the acceptor, however
+it exits."""
+import socket
+import signal
+import multiprocessing
+import zlib
+from asyncio import (
+    run, wait_for, create_task, get_running_loop, Future, TimeoutError,
+    StreamReader, StreamReaderProtocol,
+)
+from functools import partial
+from typing import Optional
+from .protocol import JSON, BINARY, MAGIC, _length
+from .rooms import RoomRegistry, DEFAULT_ROOM
+from .journal import Journal
+from .server import HOST, PORT, handle_connection, watch, refill
+from .metrics import serve_metrics
+from .logs import logger, fields, setup_logging, SAMPLE
+from deck import SHUFFLES
+from bot import BUDGET, start_bots, stop_bots
+from logging import INFO
+
+MAX_HANDOFF = 2048 # bytes of a connection the acceptor may read before handing it off
+HANDOFF_TIMEOUT = 10 # seconds a new connection has to send its first message
+STOP_TIMEOUT = 5 # seconds a worker has to close its journal once asked to stop
+
+
+def route(data: bytes) -> Optional[str]:
+    """Returns the room named by the first message in data, or None if it is not complete yet."""
+    try:
+        if data.startswith(MAGIC):
+            start = len(MAGIC) + _length.size
+            if len(data) < start:
+                return None
+            end = start + _length.unpack_from(data, len(MAGIC))[0]
+            if len(data) < end:
+                return None
+            info = BINARY.decode(data[start:end])
+        elif MAGIC.startswith(data):
+            return None
+        else:
+            end = data.find(b"\n")
+            if end < 0:
+                return None
+            info = JSON.decode(data[:end + 1])
+    except ValueError:
+        return DEFAULT_ROOM # let the worker reject it
+
+    room = info.get("room", DEFAULT_ROOM) if isinstance(info, dict) else DEFAULT_ROOM
+    return room if isinstance(room, str) else DEFAULT_ROOM
+
+def shard(room_id: str, shards: int) -> int:
+    return zlib.crc32(room_id.encode()) % shards
+
+
+def receive(rooms: RoomRegistry, control: socket.socket, stopped: Future):
+    """Adopts connections handed over by the acceptor, replaying the bytes it already read.
+    Sets stopped once the acceptor has closed its end."""
+    loop = get_running_loop()
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(control, MAX_HANDOFF, 1)
+        except BlockingIOError:
+            return
+        if not data and not fds:
+            loop.remove_reader(control.fileno())
+            if not stopped.done():
+                stopped.set_result(None)
+            return
+        for fd in fds:
+            reader = StreamReader()
+            reader.feed_data(data)
+            protocol = StreamReaderProtocol(reader, partial(handle_connection, rooms))
+            create_task(loop.connect_accepted_socket(lambda protocol=protocol: protocol, socket.socket(fileno=fd)))
+
+async def serve_shard(
+    control: socket.socket, journal_path: Optional[str], metrics_port: Optional[int], shuffle_pool: int,
+    bot_budget: float, shards: int,
+):
+    rooms = RoomRegistry()
+    start_bots(bot_budget, shards)
+    watch(rooms)
+    SHUFFLES.size = shuffle_pool
+    refill_task = create_task(refill(SHUFFLES))
+    if metrics_port is not None:
+        metrics_server = await serve_metrics(HOST, metrics_port)
+    if journal_path is not None:
+        rooms.recover(journal_path)
+        rooms.journal = Journal(journal_path)
+        journal_task = create_task(rooms.journal.run())
+
+    loop = get_running_loop()
+    stopped = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, lambda: stopped.done() or stopped.set_result(None))
+    control.setblocking(False)
+    loop.add_reader(control.fileno(), receive, rooms, control, stopped)
+    try:
+        await stopped
+    finally:
+        refill_task.cancel()
+        if metrics_port is not None:
+            metrics_server.close()
+        if rooms.journal is not None:
+            journal_task.cancel()
+            rooms.journal.close()
+        stop_bots()
+
+def run_shard(
+    control: socket.socket, inherited: list[socket.socket], journal_path: Optional[str],
+    metrics_port: Optional[int], log_level: int | str, log_sample: int, shuffle_pool: int,
+    bot_budget: float, shards: int,
+):
+    # the acceptor's ends of the control sockets, which a forked worker holds copies of;
+    # closed so that the acceptor closing them is seen as the end of the socket
+    for other in inherited:
+        other.close()
+    setup_logging(log_level, log_sample)
+    try:
+        run(serve_shard(control, journal_path, metrics_port, shuffle_pool, bot_budget, shards))
+    except KeyboardInterrupt:
+        pass
+
+
+async def hand_off(connection: socket.socket, shards: list[socket.socket]):
+    loop = get_running_loop()
+    data = b""
+    try:
+        while (room_id := route(data)) is None:
+            if len(data) >= MAX_HANDOFF:
+                return
+            chunk = await wait_for(loop.sock_recv(connection, MAX_HANDOFF - len(data)), HANDOFF_TIMEOUT)
+            if not chunk:
+                return
+            data += chunk
+        socket.send_fds(shards[shard(room_id, len(shards))], [data], [connection.fileno()])
+    except (ConnectionError, TimeoutError, OSError):
+        pass
+    finally:
+        connection.close()
+
+async def accept(listener: socket.socket, shards: list[socket.socket]):
+    loop = get_running_loop()
+    pending = set()
+    while True:
+        connection, _ = await loop.sock_accept(listener)
+        task = create_task(hand_off(connection, shards))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+def interrupt(*_):
+    """Stops the acceptor on SIGTERM the way Ctrl-C does."""
+    raise KeyboardInterrupt
+
+def host_sharded(
+    workers: int, host: str = HOST, port: int = PORT, journal_path: Optional[str] = None,
+    metrics_port: Optional[int] = None, log_level: int | str = INFO, log_sample: int = SAMPLE,
+    shuffle_pool: int = 0, bot_budget: float = BUDGET,
+):
+    """Starts `workers` shard processes and accepts connections for them until interrupted.
+
+    With a journal path, each worker journals to (and recovers from) its own file. With a
+    metrics port, worker i serves its metrics on metrics_port + i."""
+    shards = []
+    processes = []
+    for i in range(workers):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = multiprocessing.Process(
+            target=run_shard,
+            args=(
+                child,
+                [*shards, parent],
+                None if journal_path is None else f"{journal_path}.{i}",
+                None if metrics_port is None else metrics_port + i,
+                log_level,
+                log_sample,
+                shuffle_pool,
+                bot_budget,
+                workers,
+            ),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        shards.append(parent)
+        processes.append(process)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+    listener.setblocking(False)
+    logger.info("serving", extra=fields(address=listener.getsockname(), workers=workers))
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        run(accept(listener, shards))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        for control in shards:
+            control.close()
+        for process in processes:
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
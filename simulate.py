@@ -0,0 +1,275 @@
+"""Vectorised self-play: thousands of games held as NumPy arrays and advanced in lockstep.
+
+Each game is a row: its draw stack as an array of faces, every player's hand as counts per
+face, the discard pile as counts per face, and the top face, pile state, direction and
+current seat. A turn is taken in every unfinished game at once, with legality looked up
+in the same PLAYABLE table that Pile.is_valid uses.
+
+The rules are those of Game: the first card of the deck starts the pile, hands are dealt
+in seat order with another deck added to the shoe whenever fewer than two hands are left,
+a player plays one legal card or draws one (and their turn ends), draw cards give the
+following player their cards and skip them, skips skip, reverses turn the direction, the
+discard pile is shuffled back under the deck when a draw needs more cards than it holds,
+and the first player with no cards wins. Calling uno is not simulated.
+
+Policies are vectorised too: given the simulator, the games to move in and a boolean
+matrix of their legal faces, a policy returns a face to play for each game (-1 to draw)
+and a colour for wild cards.
+
+Run from the repository root:  python simulate.py [--games N] [--players P] [--policy NAME]
+"""
+import json
+import time
+from argparse import ArgumentParser
+from typing import Callable, Optional
+
+import numpy as np
+
+from deck import (
+    FACES, FACE_COUNT, WILD_FACE, CARD_FACE, CARD_COUNT, COLOURS, PLAYABLE, STATE_COUNT,
+    WILD_STATE, ColourValue, WildValue,
+)
+from game import HAND_SIZE
+
+PLAYABLE_TABLE = np.frombuffer(PLAYABLE, dtype=np.uint8).reshape(STATE_COUNT, FACE_COUNT).astype(bool)
+DECK_FACES = np.frombuffer(CARD_FACE, dtype=np.uint8)
+
+EFFECTS = ("number", "draw_two", "skip", "reverse", "wild", "draw_four")
+NUMBER, DRAW_TWO, SKIP, REVERSE, WILD, DRAW_FOUR = range(len(EFFECTS))
+_EFFECT_OF = {ColourValue.DRAW_TWO: DRAW_TWO, ColourValue.SKIP: SKIP, ColourValue.REVERSE: REVERSE,
+              WildValue.WILD: WILD, WildValue.DRAW_4: DRAW_FOUR}
+
+FACE_EFFECT = np.array([_EFFECT_OF.get(value, NUMBER) for _, value in FACES], dtype=np.int8)
+# cards given to the following player, and how many seats the turn moves on, per face played
+FACE_PENALTY = np.array([{DRAW_TWO: 2, DRAW_FOUR: 4}.get(effect, 0) for effect in FACE_EFFECT], dtype=np.int8)
+FACE_ADVANCE = np.array([2 if effect in (DRAW_TWO, SKIP, DRAW_FOUR) else 1 for effect in FACE_EFFECT], dtype=np.int8)
+# FACE_COLOURS[face, colour] is 1 if face has that colour
+FACE_COLOURS = np.array([[colour == c for c in COLOURS] for colour, _ in FACES], dtype=np.int16)
+
+Policy = Callable[["Simulator", np.ndarray, np.ndarray], tuple[np.ndarray, np.ndarray]]
+
+
+def favourite_colour(sim: "Simulator", games: np.ndarray) -> np.ndarray:
+    """The colour each current player holds the most cards of, to name when playing a wild."""
+    return (sim.hands[games, sim.current[games]] @ FACE_COLOURS).argmax(axis=1)
+
+def first_legal(sim: "Simulator", games: np.ndarray, legal: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Plays the legal face with the lowest index."""
+    return np.where(legal.any(axis=1), legal.argmax(axis=1), -1), favourite_colour(sim, games)
+
+def random_legal(sim: "Simulator", games: np.ndarray, legal: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Plays a legal face chosen uniformly at random."""
+    keys = np.where(legal, sim.rng.random(legal.shape), -1.0)
+    return np.where(legal.any(axis=1), keys.argmax(axis=1), -1), favourite_colour(sim, games)
+
+def aggressive(sim: "Simulator", games: np.ndarray, legal: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Plays the strongest legal card, keeping wild cards until nothing else can be played."""
+    priority = np.array([3, 5, 4, 2, 1, 6], dtype=np.float64)[FACE_EFFECT]
+    priority[WILD_FACE:] = (1, 0.5)
+    keys = np.where(legal, priority + sim.rng.random(legal.shape) * 0.1, -1.0)
+    return np.where(legal.any(axis=1), keys.argmax(axis=1), -1), favourite_colour(sim, games)
+
+POLICIES: dict[str, Policy] = {"first": first_legal, "random": random_legal, "aggressive": aggressive}
+
+
+class Simulator:
+    deck: np.ndarray       # (games, capacity) faces; the top of each stack is at deck_len - 1
+    deck_len: np.ndarray
+    hands: np.ndarray      # (games, players, faces) counts
+    discards: np.ndarray   # (games, faces) counts of the cards beneath the top card
+    top: np.ndarray        # top face of each pile
+    state: np.ndarray      # pile state of each game, as Card.state
+    direction: np.ndarray
+    current: np.ndarray
+    turns: np.ndarray
+    finished: np.ndarray
+    winner: np.ndarray     # seat of the winner, or -1 while unfinished or if abandoned
+
+    def __init__(self, games: int, players: int, seed: Optional[int] = None):
+        self.games = games
+        self.players = players
+        self.rng = np.random.default_rng(seed)
+        self.effects = np.zeros(len(EFFECTS), dtype=np.int64)
+        self.draws = 0
+        self.penalty_cards = 0
+        self.recycles = 0
+
+        # the shoe grows exactly as it does in Game.add_player, so work out its final size first
+        size, decks = CARD_COUNT - 1, 1
+        for _ in range(players):
+            size -= HAND_SIZE
+            if size < HAND_SIZE * 2:
+                size += CARD_COUNT
+                decks += 1
+        self.decks = decks
+
+        every = np.arange(games)
+        self.deck = np.zeros((games, decks * CARD_COUNT), dtype=np.uint8)
+        self.deck[:, :CARD_COUNT] = self.rng.permuted(np.tile(DECK_FACES, (games, 1)), axis=1)
+        self.deck_len = np.full(games, CARD_COUNT, dtype=np.int64)
+        self.hands = np.zeros((games, players, FACE_COUNT), dtype=np.int16)
+        self.discards = np.zeros((games, FACE_COUNT), dtype=np.int16)
+
+        self.top = self._pop(every)
+        # an uncoloured wild on an empty pile has no colour yet, as in Pile.place
+        self.state = np.where(self.top < WILD_FACE, self.top, WILD_STATE + len(COLOURS)).astype(np.int64)
+        size = CARD_COUNT - 1
+        for seat in range(players):
+            for _ in range(HAND_SIZE):
+                self.hands[every, seat, self._pop(every)] += 1
+            size -= HAND_SIZE
+            if size < HAND_SIZE * 2:
+                self.deck[:, size:size + CARD_COUNT] = DECK_FACES
+                size += CARD_COUNT
+                self.deck_len[:] = size
+                self.deck[:, :size] = self.rng.permuted(self.deck[:, :size], axis=1)
+
+        self.direction = np.ones(games, dtype=np.int64)
+        self.current = np.zeros(games, dtype=np.int64)
+        self.turns = np.zeros(games, dtype=np.int64)
+        self.finished = np.zeros(games, dtype=bool)
+        self.winner = np.full(games, -1, dtype=np.int64)
+
+    def empty(games: int, players: int, decks: int, seed: Optional[int] = None) -> "Simulator":
+        """A simulator with nothing dealt, for callers that lay out positions of their own.
+        Every card must be placed in the deck, a hand, the discards or the top."""
+        sim = Simulator.__new__(Simulator)
+        sim.games, sim.players, sim.decks = games, players, decks
+        sim.rng = np.random.default_rng(seed)
+        sim.effects = np.zeros(len(EFFECTS), dtype=np.int64)
+        sim.draws = sim.penalty_cards = sim.recycles = 0
+        sim.deck = np.zeros((games, decks * CARD_COUNT), dtype=np.uint8)
+        sim.deck_len = np.zeros(games, dtype=np.int64)
+        sim.hands = np.zeros((games, players, FACE_COUNT), dtype=np.int16)
+        sim.discards = np.zeros((games, FACE_COUNT), dtype=np.int16)
+        sim.top = np.zeros(games, dtype=np.int64)
+        sim.state = np.zeros(games, dtype=np.int64)
+        sim.direction = np.ones(games, dtype=np.int64)
+        sim.current = np.zeros(games, dtype=np.int64)
+        sim.turns = np.zeros(games, dtype=np.int64)
+        sim.finished = np.zeros(games, dtype=bool)
+        sim.winner = np.full(games, -1, dtype=np.int64)
+        return sim
+
+    def _pop(self, games: np.ndarray) -> np.ndarray:
+        self.deck_len[games] -= 1
+        return self.deck[games, self.deck_len[games]]
+
+    def _recycle(self, game: int):
+        """Shuffles a game's discards beneath its draw stack, as Deck.recycle does."""
+        faces = np.repeat(np.arange(FACE_COUNT, dtype=np.uint8), self.discards[game])
+        self.rng.shuffle(faces)
+        n, size = len(faces), self.deck_len[game]
+        self.deck[game, n:n + size] = self.deck[game, :size].copy()
+        self.deck[game, :n] = faces
+        self.deck_len[game] += n
+        self.discards[game] = 0
+        self.recycles += 1
+
+    def give(self, games: np.ndarray, seats: np.ndarray, n: int) -> int:
+        """Deals up to n cards to a seat in each game, as Game.draw does. Returns the cards dealt."""
+        for game in games[self.deck_len[games] < n]:
+            self._recycle(game)
+        available = np.minimum(n, self.deck_len[games])
+        for k in range(n):
+            dealt = available > k
+            self.hands[games[dealt], seats[dealt], self._pop(games[dealt])] += 1
+        return int(available.sum())
+
+    def step(self, policies: list[Policy]):
+        """Takes one turn in every unfinished game."""
+        games = np.flatnonzero(~self.finished)
+        seats = self.current[games]
+        legal = (self.hands[games, seats] > 0) & PLAYABLE_TABLE[self.state[games]]
+
+        faces = np.empty(len(games), dtype=np.int64)
+        colours = np.empty(len(games), dtype=np.int64)
+        if len(policies) == 1:
+            faces[:], colours[:] = policies[0](self, games, legal)
+        else:
+            for seat, policy in enumerate(policies):
+                mine = seats == seat
+                if mine.any():
+                    faces[mine], colours[mine] = policy(self, games[mine], legal[mine])
+        playing = faces >= 0
+        if not legal[np.flatnonzero(playing), faces[playing]].all():
+            raise ValueError("policy chose a card that cannot be played")
+        self.turns[games] += 1
+
+        drawing = games[~playing]
+        self.draws += self.give(drawing, self.current[drawing], 1)
+        self.current[drawing] = (self.current[drawing] + self.direction[drawing]) % self.players
+
+        games, seats, faces, colours = games[playing], seats[playing], faces[playing], colours[playing]
+        self.hands[games, seats, faces] -= 1
+        self.discards[games, self.top[games]] += 1
+        self.top[games] = faces
+        self.state[games] = np.where(faces < WILD_FACE, faces, WILD_STATE + colours)
+        self.effects += np.bincount(FACE_EFFECT[faces], minlength=len(EFFECTS))
+
+        won = self.hands[games, seats].sum(axis=1) == 0
+        self.finished[games[won]] = True
+        self.winner[games[won]] = seats[won]
+        games, seats, faces = games[~won], seats[~won], faces[~won]
+
+        reverse = FACE_EFFECT[faces] == REVERSE
+        self.direction[games[reverse]] *= -1
+        for penalty in (2, 4):
+            hit = FACE_PENALTY[faces] == penalty
+            victims = (seats[hit] + self.direction[games[hit]]) % self.players
+            self.penalty_cards += self.give(games[hit], victims, penalty)
+        self.current[games] = (seats + self.direction[games] * FACE_ADVANCE[faces]) % self.players
+
+    def run(self, policies: list[Policy], max_turns: int = 2000):
+        """Plays every game to the end. Games still going after max_turns are abandoned."""
+        while not self.finished.all():
+            self.step(policies)
+            if self.turns.max() >= max_turns:
+                self.finished[self.turns >= max_turns] = True
+
+    def report(self) -> dict:
+        won = self.winner >= 0
+        lengths = self.turns[won]
+        return {
+            "games": self.games,
+            "players": self.players,
+            "decks": self.decks,
+            "abandoned": int((~won).sum()),
+            "win_rate": (np.bincount(self.winner[won], minlength=self.players) / max(1, won.sum())).tolist(),
+            "turns": {
+                "mean": float(lengths.mean()) if len(lengths) else 0.0,
+                **{f"p{q}": float(np.percentile(lengths, q)) if len(lengths) else 0.0 for q in (50, 95, 99)},
+            },
+            "per_game": {
+                **{effect: int(n) / self.games for effect, n in zip(EFFECTS, self.effects)},
+                "draws": self.draws / self.games,
+                "penalty_cards": self.penalty_cards / self.games,
+                "recycles": self.recycles / self.games,
+            },
+        }
+
+
+def main():
+    parser = ArgumentParser(description="Simulates games in lockstep and reports their statistics.")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--policy", action="append", choices=POLICIES,
+                        help="policy for every seat, or repeat once per seat (default random)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    names = args.policy or ["random"]
+    if len(names) not in (1, args.players):
+        parser.error("give one policy, or one per seat")
+
+    start = time.perf_counter()
+    sim = Simulator(args.games, args.players, args.seed)
+    sim.run([POLICIES[name] for name in names], args.max_turns)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({**sim.report(), "policies": names, "seconds": elapsed, "games_per_second": args.games / elapsed}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
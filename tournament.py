@@ -0,0 +1,243 @@
+"""Plays many headless games between bot policies on Game, spread over a process pool, and
+rates the policies as the results come in.
+
+Every game's outcome is appended to a results file: a header recording the tournament's
+configuration, then one fixed-size record per game. Game i always gets the same seed,
+seating and policy randomness for a given tournament seed, and results are written and
+rated in game order, so an interrupted run picks up where its file ends and a finished
+run is the same whether or not it was ever interrupted.
+
+Run from the repository root:
+    python tournament.py results.uno --policy random --policy heuristic --policy mc --games 10000
+"""
+import json
+import math
+import os
+import random
+import signal
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from struct import Struct
+from typing import BinaryIO, Callable
+
+import numpy as np
+
+from bot import Position, heuristic, move, rollouts
+from game import Game, Player
+
+MAGIC = b"UNOT"
+VERSION = 1
+_header = Struct("!4sBH") # magic, version, configuration length
+# game index, turns, winning seat (NO_WINNER if abandoned); followed by one policy index per seat
+_record = Struct("!IHB")
+NO_WINNER = 0xff
+
+K_FACTOR = 32
+INITIAL_RATING = 1500.0
+FLUSH_EVERY = 64
+
+
+Policy = Callable[[Game, Player, list[int], random.Random, dict], int]
+
+def random_legal(game: Game, player: Player, candidates: list[int], rng: random.Random, options: dict) -> int:
+    return rng.choice(candidates)
+
+def first_legal(game: Game, player: Player, candidates: list[int], rng: random.Random, options: dict) -> int:
+    return candidates[0]
+
+def heuristic_move(game: Game, player: Player, candidates: list[int], rng: random.Random, options: dict) -> int:
+    return heuristic(game, player, candidates)
+
+def monte_carlo(game: Game, player: Player, candidates: list[int], rng: random.Random, options: dict) -> int:
+    """The bots' search with a fixed number of deals instead of a time budget, so it is
+    reproducible."""
+    wins, played = rollouts(Position(game, player), candidates, options["deals"], math.inf, rng.getrandbits(32))
+    return candidates[int(np.argmax(wins / np.maximum(played, 1)))]
+
+POLICIES: dict[str, Policy] = {"random": random_legal, "first": first_legal, "heuristic": heuristic_move, "mc": monte_carlo}
+
+
+def ignore_interrupts():
+    """Leaves Ctrl-C to the parent, which stops handing out games and lets running ones finish."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def game_seed(seed: int, index: int) -> int:
+    return seed << 32 | index
+
+def lineup(seed: int, index: int, policies: int, players: int) -> tuple[int, ...]:
+    """The policy in each seat of a game, chosen from the game's seed."""
+    rng = random.Random(game_seed(seed, index) ^ 0x5eed)
+    if policies >= players:
+        return tuple(rng.sample(range(policies), players))
+    return tuple(rng.choices(range(policies), k=players))
+
+def play(config: dict, index: int) -> tuple[int, int, int, tuple[int, ...]]:
+    """Plays game index of a tournament. Returns its index, length in turns, winning seat
+    and lineup."""
+    seats = lineup(config["seed"], index, len(config["policies"]), config["players"])
+    policies = [POLICIES[config["policies"][policy]] for policy in seats]
+    seed = game_seed(config["seed"], index)
+    rng = random.Random(seed)
+
+    game = Game(seed=seed) # headless: no broadcast manager
+    for seat in range(config["players"]):
+        game.add_player(Player(f"seat-{seat}", game.deck))
+    game.start()
+
+    turns = 0
+    while not game.finished and turns < config["max_turns"]:
+        player = game.current_player()
+        candidates = sorted({player.hand.cards[i].face for i in player.hand.legal_moves(game.pile)})
+        face = policies[player.seat](game, player, candidates, rng, config) if candidates else -1
+        game.process(move(player, face))
+        turns += 1
+
+    winner = next((player.seat for player in game.players if not player.hand.cards), NO_WINNER)
+    return index, turns, winner, seats
+
+
+class Ratings:
+    """Elo ratings, updated one game at a time. A win counts as beating every other seat."""
+    ratings: list[float]
+    games: list[int]
+    wins: list[int]
+
+    def __init__(self, policies: int):
+        self.ratings = [INITIAL_RATING] * policies
+        self.games = [0] * policies
+        self.wins = [0] * policies
+
+    def update(self, seats: tuple[int, ...], winner: int):
+        for policy in seats:
+            self.games[policy] += 1
+        if winner == NO_WINNER:
+            return
+        best = seats[winner]
+        self.wins[best] += 1
+
+        k = K_FACTOR / (len(seats) - 1)
+        deltas = [0.0] * len(self.ratings)
+        for seat, policy in enumerate(seats):
+            if seat == winner or policy == best:
+                continue
+            expected = 1 / (1 + 10 ** ((self.ratings[policy] - self.ratings[best]) / 400))
+            deltas[best] += k * (1 - expected)
+            deltas[policy] -= k * (1 - expected)
+        self.ratings = [rating + delta for rating, delta in zip(self.ratings, deltas)]
+
+    def table(self, names: list[str]) -> str:
+        lines = [f"{'policy':<12}{'rating':>8}{'games':>9}{'wins':>8}{'win rate':>10}"]
+        for policy in sorted(range(len(names)), key=lambda policy: -self.ratings[policy]):
+            games = self.games[policy]
+            lines.append(f"{names[policy]:<12}{self.ratings[policy]:>8.0f}{games:>9}{self.wins[policy]:>8}"
+                         f"{self.wins[policy] / max(1, games):>10.1%}")
+        return "\n".join(lines)
+
+
+class Results:
+    """The results file of one tournament, opened for appending."""
+    config: dict
+    file: BinaryIO
+    start: int # offset of the first record
+    size: int # of one record
+    count: int # of records written
+
+    def __init__(self, path: str, config: dict):
+        self.config = config
+        self.size = _record.size + config["players"]
+        encoded = json.dumps(config, sort_keys=True).encode()
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self.file = open(path, "w+b")
+            self.file.write(_header.pack(MAGIC, VERSION, len(encoded)) + encoded)
+            self.file.flush()
+            self.start = self.file.tell()
+            self.count = 0
+            return
+
+        self.file = open(path, "r+b")
+        magic, version, length = _header.unpack(self.file.read(_header.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} results file")
+        stored = json.loads(self.file.read(length))
+        if stored != config:
+            raise ValueError(f"{path} holds a different tournament: {stored}")
+        self.start = _header.size + length
+        self.count = (os.path.getsize(path) - self.start) // self.size
+        # drop a record torn by an interruption
+        self.file.truncate(self.start + self.count * self.size)
+        self.file.seek(0, os.SEEK_END)
+
+    def read(self) -> list[tuple[int, int, int, tuple[int, ...]]]:
+        self.file.seek(self.start)
+        data = self.file.read(self.count * self.size)
+        self.file.seek(0, os.SEEK_END)
+        records = []
+        for offset in range(0, len(data), self.size):
+            index, turns, winner = _record.unpack_from(data, offset)
+            records.append((index, turns, winner, tuple(data[offset + _record.size:offset + self.size])))
+        return records
+
+    def append(self, index: int, turns: int, winner: int, seats: tuple[int, ...]):
+        self.file.write(_record.pack(index, min(turns, 0xffff), winner) + bytes(seats))
+        self.count += 1
+        if self.count % FLUSH_EVERY == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = ArgumentParser(description="Plays bot policies against each other and rates them.")
+    parser.add_argument("results", help="results file, created or resumed")
+    parser.add_argument("--policy", action="append", choices=POLICIES, help="an entrant; repeat for each (default all)")
+    parser.add_argument("--games", type=int, default=1000, help="games the tournament should have in total")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--deals", type=int, default=32, help="deals per candidate move for mc")
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    if not 0 <= args.seed < 1 << 31:
+        parser.error("seed must be from 0 to 2**31 - 1")
+    if not 2 <= args.players < NO_WINNER:
+        parser.error("players must be from 2 to 254")
+
+    config = {
+        "policies": args.policy or list(POLICIES), "players": args.players, "seed": args.seed,
+        "deals": args.deals, "max_turns": args.max_turns,
+    }
+    try:
+        results = Results(args.results, config)
+    except ValueError as e:
+        parser.error(str(e))
+
+    ratings = Ratings(len(config["policies"]))
+    for _, _, winner, seats in results.read():
+        ratings.update(seats, winner)
+    resumed = results.count
+
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(args.workers, initializer=ignore_interrupts)
+    try:
+        for index, turns, winner, seats in executor.map(partial(play, config), range(resumed, args.games), chunksize=8):
+            results.append(index, turns, winner, seats)
+            ratings.update(seats, winner)
+    except KeyboardInterrupt:
+        print("interrupted; run again to resume", file=sys.stderr)
+    finally:
+        results.close()
+        executor.shutdown(cancel_futures=True)
+
+    played = results.count - resumed
+    elapsed = time.perf_counter() - start
+    print(f"{results.count} games ({resumed} resumed, {played} played in {elapsed:.1f}s, {played / max(elapsed, 1e-9):.0f} games/s)")
+    print(ratings.table(config["policies"]))
+
+
+if __name__ == "__main__":
+    main()